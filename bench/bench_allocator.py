@@ -0,0 +1,89 @@
+"""Benchmarks subnet and host IP assignment: IPAllocator vs the legacy string scan.
+
+Usage: python bench/bench_allocator.py [--rows 10000 100000 1000000] [--legacy-max 10000]
+"""
+import argparse
+import ipaddress
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ipallocator import IPAllocator  # noqa: E402
+
+BASE_NETWORK = "10.0.0.0/8"
+SUBNET_PREFIX = 27
+STORES_PER_CLIENT = 20
+
+
+def make_rows(count):
+    """Returns (client, subnet, ip) rows; the first half of the clients are already assigned."""
+    rows = []
+    assigned_clients = count // STORES_PER_CLIENT // 2
+    subnets = ipaddress.IPv4Network(BASE_NETWORK).subnets(new_prefix=SUBNET_PREFIX)
+    for client in range(count // STORES_PER_CLIENT + 1):
+        subnet = next(subnets) if client < assigned_clients else None
+        hosts = subnet.hosts() if subnet else None
+        for _ in range(STORES_PER_CLIENT):
+            if len(rows) == count:
+                return rows
+            rows.append((client, str(subnet) if subnet else None, str(next(hosts)) if hosts else None))
+    return rows
+
+
+def legacy(rows):
+    """Subnet and IP assignment as done by netconfig.py before IPAllocator."""
+    subnets_by_client = {client: subnet for client, subnet, _ in rows if subnet}
+    used_subnets = set(subnets_by_client.values())
+    available = (str(s) for s in ipaddress.IPv4Network(BASE_NETWORK).subnets(new_prefix=SUBNET_PREFIX))
+    unused = (s for s in available if s not in used_subnets)
+    used_ips = {ip for _, _, ip in rows if ip}
+    for client, subnet, ip in rows:
+        if subnet is None:
+            subnet = subnets_by_client.get(client)
+            if subnet is None:
+                subnet = subnets_by_client[client] = next(unused)
+        if ip is None:
+            for host in ipaddress.IPv4Network(subnet).hosts():
+                if str(host) not in used_ips:
+                    used_ips.add(str(host))
+                    break
+
+
+def allocator(rows):
+    """Subnet and IP assignment through IPAllocator."""
+    subnets_by_client = {client: subnet for client, subnet, _ in rows if subnet}
+    ip_allocator = IPAllocator.from_columns(
+        BASE_NETWORK, SUBNET_PREFIX, (row[1] for row in rows), (row[2] for row in rows)
+    )
+    for client, subnet, ip in rows:
+        if subnet is None:
+            subnet = subnets_by_client.get(client)
+            if subnet is None:
+                subnet = subnets_by_client[client] = ip_allocator.allocate_subnet()
+        if ip is None:
+            ip_allocator.allocate_host(subnet)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=10_000, help="Largest size measured with the legacy scan")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'allocator (s)':>14}")
+    for count in args.rows:
+        rows = make_rows(count)
+        legacy_time = "skipped"
+        if count <= args.legacy_max:
+            start = time.perf_counter()
+            legacy(rows)
+            legacy_time = f"{time.perf_counter() - start:.3f}"
+        start = time.perf_counter()
+        allocator(rows)
+        print(f"{count:>10} {legacy_time:>12} {time.perf_counter() - start:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Compares WireGuard key generation throughput: native engine vs `wg` subprocesses.
+
+Usage: python bench/bench_keys.py [--count N]
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import wgkeys  # noqa: E402
+
+
+def measure(generator, count):
+    """Returns keys per second for a batch generator."""
+    start = time.perf_counter()
+    generator(count)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000, help="Number of key pairs per backend")
+    args = parser.parse_args()
+
+    engine = "cryptography" if wgkeys.X25519PrivateKey is not None else "pure-python"
+    print(f"native ({engine}): {measure(wgkeys.generate_keys, args.count):10.1f} keys/s")
+
+    if shutil.which("wg") is None:
+        print("wg subprocess:      skipped (wg binary not found)")
+        return
+    # El camino por subprocesos es mucho mas lento: se mide con menos claves
+    count = max(1, args.count // 20)
+    print(f"wg subprocess:      {measure(wgkeys.generate_keys_subprocess, count):10.1f} keys/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Runs several pipelines at the same time and checks that they do not corrupt each other's outputs.
+
+Starts --runs pipelines at once, each in its own process, against the same
+database and output folder (they must wait for each other on the run lock),
+and then --tenants pipelines against separate databases (they must run in
+parallel). Afterwards every database must load, every IP must be unique and
+every peer's public key must match the private key of its .conf file.
+
+Usage: python bench/bench_locking.py [--rows 2000] [--runs 3] [--tenants 3]
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+import storage  # noqa: E402
+from run_benchmarks import make_config  # noqa: E402
+from synth import make_inventory  # noqa: E402
+from tunnels import config_name, list_configs, read_peer_config  # noqa: E402
+from wgkeys import public_key  # noqa: E402
+
+
+def run_child(database_path, output_path):
+    """Runs the pipeline in this process."""
+    from pipeline import Pipeline
+
+    config = make_config(database_path, output_path, "native")
+    config["output"]["run_report"] = "false"
+    with contextlib.redirect_stdout(io.StringIO()):
+        Pipeline(config).run()
+
+
+def run_together(jobs):
+    """Starts one process per (database, output folder) at once and waits for all. Returns the seconds taken."""
+    start = time.perf_counter()
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", database_path, output_path])
+        for database_path, output_path in jobs
+    ]
+    if any(process.wait() != 0 for process in processes):
+        print("ERROR: una ejecucion fallo")
+        sys.exit(1)
+    return time.perf_counter() - start
+
+
+def problems(database_path, output_path):
+    """Returns what is wrong with the outputs of one database (an empty list if nothing)."""
+    df = storage.load_database(database_path)
+    found = []
+    ips = df["ip"].dropna()
+    if ips.duplicated().any():
+        found.append(f"{int(ips.duplicated().sum())} IPs repetidas")
+    configs = list_configs(os.path.join(output_path, "tunnels"))
+    # Solo los nombres unicos: los peers que comparten nombre comparten tambien el .conf
+    peers = df.dropna(subset=["nombre_vpn"]).drop_duplicates("nombre_vpn", keep=False)
+    mismatched = 0
+    for nombre_vpn, public in zip(peers["nombre_vpn"], peers["clave_publica"]):
+        keys = read_peer_config(configs.get(config_name(nombre_vpn), ""))
+        if not keys or public_key(keys["PrivateKey"]) != public:
+            mismatched += 1
+    if mismatched:
+        found.append(f"{mismatched} claves publicas que no coinciden con su .conf")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3, help="simultaneous runs against the same database")
+    parser.add_argument("--tenants", type=int, default=3, help="simultaneous runs against separate databases")
+    parser.add_argument("--format", choices=["csv", "parquet", "xlsx"], default="xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(*args.child)
+        return
+
+    inventory = make_inventory(args.rows, seed=args.seed)
+    print(f"{args.rows} filas ({args.format})")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = [(os.path.join(tmp, "shared", "inventory." + args.format), os.path.join(tmp, "shared", "output"))]
+        tenants = [
+            (os.path.join(tmp, f"tenant_{i}", "inventory." + args.format), os.path.join(tmp, f"tenant_{i}", "output"))
+            for i in range(args.tenants)
+        ]
+        for database_path, _ in shared + tenants:
+            os.makedirs(os.path.dirname(database_path))
+            storage.save_database(inventory, database_path)
+
+        for name, jobs, outputs in [
+            (f"{args.runs} ejecuciones, misma base", shared * args.runs, shared),
+            (f"{args.tenants} clientes, bases separadas", tenants, tenants),
+        ]:
+            elapsed = run_together(jobs)
+            found = [problem for database_path, output_path in outputs for problem in problems(database_path, output_path)]
+            print(f"{name:<32} {elapsed:>8.2f} s  {'; '.join(found) or 'ok'}")
+            failed = failed or bool(found)
+    if failed:
+        print("ERROR: las ejecuciones simultaneas dejaron salidas inconsistentes")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Measures the peak memory of a pipeline run, in one piece and in batches of rows (batch_rows).
+
+Generates a synthetic inventory with bench/synth.py and runs the three
+stages on it in a fresh interpreter for every --batch-rows value (0: the
+whole database at once), so each run reports its own peak RSS. Every run
+must produce the same subnets and IPs. Unix only (uses the resource module).
+
+Usage: python bench/bench_memory.py [--rows 200000] [--batch-rows 0 10000 50000] [--format csv]
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+
+def run_child(database_path, output_path, batch_rows):
+    """Runs the pipeline in this process and prints "seconds peak_mb"."""
+    import resource
+    from pipeline import Pipeline
+    from run_benchmarks import make_config
+
+    config = make_config(database_path, output_path, "native")
+    config["netconfig"]["batch_rows"] = str(batch_rows)
+    config["output"]["run_report"] = "false"
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        Pipeline(config).run()
+    elapsed = time.perf_counter() - start
+    # ru_maxrss esta en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1e6 if sys.platform == "darwin" else peak / 1024
+    print(f"{elapsed:.3f} {peak_mb:.1f}")
+
+
+def measure(database_path, output_path, batch_rows):
+    """Runs one pipeline in a new interpreter. Returns (seconds, peak MB)."""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", database_path, output_path, str(batch_rows)],
+        capture_output=True, text=True, check=True,
+    )
+    elapsed, peak = result.stdout.split()[-2:]
+    return float(elapsed), float(peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[0, 10_000, 50_000])
+    parser.add_argument("--format", choices=["csv", "parquet", "xlsx"], default="csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child[0], args.child[1], int(args.child[2]))
+        return
+
+    import storage
+    from synth import make_inventory
+
+    print(f"{args.rows} filas ({args.format})")
+    print(f"{'batch_rows':>10} {'tiempo (s)':>11} {'pico RSS (MB)':>14}")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source." + args.format)
+        storage.save_database(make_inventory(args.rows, seed=args.seed), source)
+        for batch_rows in args.batch_rows:
+            run_dir = os.path.join(tmp, f"run_{batch_rows}")
+            os.makedirs(run_dir)
+            database_path = os.path.join(run_dir, "inventory." + args.format)
+            storage.save_database(storage.load_database(source), database_path)
+            elapsed, peak = measure(database_path, os.path.join(run_dir, "output"), batch_rows)
+            print(f"{batch_rows or 'todo':>10} {elapsed:>11.2f} {peak:>14.1f}")
+            df = storage.load_database(database_path)
+            results[batch_rows] = df[["grupo", "subred", "ip"]].astype(str).values.tolist()
+    if len({str(assigned) for assigned in results.values()}) > 1:
+        print("ERROR: las ejecuciones asignaron subredes o IPs distintas")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
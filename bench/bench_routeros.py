@@ -0,0 +1,115 @@
+"""Times pushing an inventory to several mock routers over the RouterOS API.
+
+Starts --routers mock routers (bench/mock_routeros.py) on localhost with
+--latency seconds per round trip, half of them already holding part of the
+entries, and pushes a synthetic inventory twice: one command per round trip
+on a single connection, router after router (what a by-hand import amounts
+to), and with the pooled, pipelined, parallel push of src/routeros.py. Both
+runs must leave every router with the same entries, whatever it held
+before, and pushing again must add nothing. With --ipv6 the mock routers
+listen on ::1 and are addressed as [::1]:port.
+
+Usage: python bench/bench_routeros.py [--rows 5000] [--routers 4] [--latency 0.005] [--ipv6]
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+import routeros  # noqa: E402
+from mikrotikconfig import collect, dataframe_rows  # noqa: E402
+from mock_routeros import MockRouter  # noqa: E402
+from run_benchmarks import make_config  # noqa: E402
+from settings import validate  # noqa: E402
+from synth import make_inventory  # noqa: E402
+
+
+def make_rows(rows, seed):
+    df = make_inventory(rows, assigned=1.0, keyed=1.0, seed=seed)
+    df["nombre_vpn"] = [f"peer-{i}" for i in range(len(df))]
+    return dataframe_rows(df)
+
+
+def make_settings(pool_size, batch_size):
+    config = make_config("inventory.csv", "output", "native")
+    config.read_dict({"routeros": {"pool_size": str(pool_size), "batch_size": str(batch_size), "timeout": "30"}})
+    return validate(config, check_paths=False)
+
+
+def start_routers(count, latency, rows, host="127.0.0.1"):
+    """Starts the mock routers; the even ones already have the first third of the entries."""
+    addresses, peers = collect(rows)
+    routers = []
+    for i in range(count):
+        router = MockRouter((host, 0), latency=latency).start()
+        if i % 2 == 0:
+            state = (set(), set(), set())
+            commands = routeros.missing_commands(addresses[:len(addresses) // 3], peers[:len(peers) // 3], state, "WG")
+            for words in commands:
+                router.execute(words)
+        routers.append(router)
+    return routers
+
+
+def snapshot(router):
+    return {menu: sorted(item.get("address") or item.get("public-key") for item in items) for menu, items in router.menus.items()}
+
+
+def run(rows, args, sequential):
+    """Pushes `rows` to fresh mock routers. Returns (seconds, entries added, errors, router states, added on a second push)."""
+    routers = start_routers(args.routers, args.latency, rows, "::1" if args.ipv6 else "127.0.0.1")
+    hosts = [f"[::1]:{router.port}" if args.ipv6 else f"127.0.0.1:{router.port}" for router in routers]
+    start = time.perf_counter()
+    if sequential:
+        settings = make_settings(pool_size=1, batch_size=1)
+        summaries = [summary for host in hosts for summary in routeros.deploy(settings, rows, [host])]
+    else:
+        summaries = routeros.deploy(make_settings(args.pool_size, args.batch_size), rows, hosts)
+    elapsed = time.perf_counter() - start
+    errors = [error for summary in summaries for error in summary["errors"]]
+    states = [snapshot(router) for router in routers]
+    # Los routers ya tienen todo: una segunda pasada solo lee su estado
+    again = routeros.deploy(make_settings(args.pool_size, args.batch_size), rows, hosts)
+    for router in routers:
+        router.shutdown()
+        router.server_close()
+    return elapsed, sum(summary["added"] for summary in summaries), errors, states, sum(summary["added"] for summary in again)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--routers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per round trip of the mock routers")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ipv6", action="store_true", help="mock routers on ::1, addressed as [::1]:port")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.seed)
+    print(f"{args.rows} filas, {args.routers} routers, latencia {args.latency * 1000:.1f} ms")
+    results = {}
+    failed = False
+    for name, sequential in [("sequential", True), ("pooled", False)]:
+        elapsed, added, errors, states, again = run(rows, args, sequential)
+        results[name] = states
+        print(f"{name:<12} {elapsed:>8.3f} s  {added} entradas agregadas, {len(errors)} errores")
+        if errors or again:
+            print(f"ERROR: {len(errors)} errores, {again} entradas agregadas al repetir")
+            failed = True
+        if any(state != states[0] for state in states):
+            print("ERROR: los routers con entradas previas quedaron distintos de los vacios")
+            failed = True
+    if results["sequential"] != results["pooled"]:
+        print("ERROR: los routers quedaron distintos")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
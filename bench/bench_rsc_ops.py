@@ -0,0 +1,89 @@
+"""Counts the router-side operations of the generated MikroTik scripts, offline.
+
+Renders mikrotik_address.rsc and mikrotik_peers.rsc in both lookup modes
+("scan" and "indexed") and replays the main loop of each script with a
+cost model: for N entries already on the router plus M new ones, it counts
+the script commands the router executes (find, get, add).
+
+Usage: python bench/bench_rsc_ops.py [--existing 1000 10000] [--new 100 1000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import mikrotikconfig  # noqa: E402
+from run_benchmarks import make_config  # noqa: E402
+from settings import mikrotik_output_path, validate  # noqa: E402
+
+UNFILTERED_FIND = re.compile(r"\[/[\w ]+? find\]")
+FILTERED_FIND = re.compile(r"\[/[\w ]+? find [^\]]+\]")
+GET = re.compile(r"\[/[\w ]+? get ")
+ADD = re.compile(r"^\s*/[\w ]+? add ", re.MULTILINE)
+
+
+def loop_costs(script):
+    """Returns (unfiltered finds, filtered finds, gets per existing item, adds) of the script's main loop."""
+    body = script[script.index(":for i from=0"):]
+    return (
+        len(UNFILTERED_FIND.findall(body)),
+        len(FILTERED_FIND.findall(body)),
+        len(GET.findall(body)),
+        len(ADD.findall(body)),
+    )
+
+
+def replay(script, existing, new):
+    """Router commands executed when the script lists `existing` entries already present plus `new` ones."""
+    unfiltered, filtered, gets, adds = loop_costs(script)
+    table = existing
+    commands = 0
+    for i in range(existing + new):
+        # Cada find sin filtro devuelve todos los elementos y el foreach hace un get por cada uno
+        commands += unfiltered + filtered + gets * table
+        if i >= existing:
+            commands += adds
+            table += 1
+    return commands
+
+
+def render(lookup, output_path):
+    """Renders both scripts for one entry and returns their text."""
+    config = make_config("inventory.csv", output_path, "native")
+    config["mikrotik"]["lookup"] = lookup
+    settings = validate(config, check_paths=False)
+    rows = [mikrotikconfig.Peer(subred="10.0.0.0/27", razon_social="c", nombre_vpn="V", ip="10.0.0.1", clave_publica="K")]
+    with contextlib.redirect_stdout(io.StringIO()):
+        mikrotikconfig.generate_scripts(rows, settings)
+    scripts = {}
+    for name in ["mikrotik_address.rsc", "mikrotik_peers.rsc"]:
+        with open(os.path.join(mikrotik_output_path(settings), name)) as file:
+            scripts[name] = file.read()
+    return scripts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--existing", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--new", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rendered = {lookup: render(lookup, os.path.join(tmp, lookup)) for lookup in ["scan", "indexed"]}
+
+    print(f"{'script':<22} {'N existing':>10} {'M new':>8} {'scan':>14} {'indexed':>10}")
+    for name in ["mikrotik_address.rsc", "mikrotik_peers.rsc"]:
+        for existing in args.existing:
+            for new in args.new:
+                scan = replay(rendered["scan"][name], existing, new)
+                indexed = replay(rendered["indexed"][name], existing, new)
+                print(f"{name:<22} {existing:>10} {new:>8} {scan:>14} {indexed:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measures the import time of the GUI and CLI entry points with python -X importtime.
+
+Each entry point is imported in a fresh interpreter --repeat times and the
+fastest run is kept. The GUI and the CLI parent process must not load pandas,
+numpy, openpyxl, pyarrow or cryptography: those are only imported when a run
+starts (or by the background prewarm of the GUI). Exits with 1 if one of
+them is loaded, or if an entry point takes longer than --max-ms.
+
+Usage: python bench/bench_startup.py [--repeat 5] [--max-ms 150] [--top 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+ENTRY_POINTS = ["mikroguard", "cli"]
+HEAVY_MODULES = ["pandas", "numpy", "openpyxl", "pyarrow", "cryptography"]
+
+
+def import_times(module):
+    """Imports `module` in a new interpreter. Returns {module name: (self us, cumulative us)}."""
+    code = f"import sys; sys.path.insert(0, {os.path.abspath(SRC_DIR)!r}); import {module}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue  # Linea de encabezado
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def measure(module, repeat):
+    """Fastest of `repeat` imports: (milliseconds, times of that run)."""
+    best = None
+    for _ in range(repeat):
+        times = import_times(module)
+        total = times[module][1] / 1000
+        if best is None or total < best[0]:
+            best = (total, times)
+    return best
+
+
+def heavy_modules(times):
+    return sorted({name.split(".")[0] for name in times} & set(HEAVY_MODULES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if an entry point takes longer than this")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    args = parser.parse_args()
+
+    failed = False
+    for module in ENTRY_POINTS:
+        total, times = measure(module, args.repeat)
+        heavy = heavy_modules(times)
+        print(f"\n{module}: {total:.1f} ms, {len(times)} modulos")
+        for name, (own, _) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+            print(f"  {own / 1000:>8.2f} ms  {name}")
+        if heavy:
+            print(f"  ERROR: importa {', '.join(heavy)} al iniciar")
+            failed = True
+        if args.max_ms is not None and total > args.max_ms:
+            print(f"  ERROR: supera el limite de {args.max_ms:.0f} ms")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
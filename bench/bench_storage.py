@@ -0,0 +1,101 @@
+"""Benchmarks reading and writing the database with each storage backend.
+
+Also times the in-place update of an existing workbook, and the legacy one
+(openpyxl load_workbook + iterrows, one cell at a time) for reference, and checks that reading each backend in batches of rows
+(batch_rows) returns the same DataFrame as reading it whole, also for a
+database without keys yet, as netconfig.py leaves it. Parquet is skipped
+when pyarrow is not installed.
+
+Usage: python bench/bench_storage.py [--rows 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pandas as pd  # noqa: E402
+from openpyxl import load_workbook  # noqa: E402
+
+import storage  # noqa: E402
+
+
+def make_database(count):
+    """Returns a fully assigned synthetic database with `count` rows."""
+    return pd.DataFrame({
+        "grupo": [f"GROUP{i // 4 + 1}" for i in range(count)],
+        "subred": [f"10.{i // 7680 % 256}.{i // 30 % 256}.0/27" for i in range(count)],
+        "razon_social": [f"cliente {i // 30}" for i in range(count)],
+        "punto_de_venta": [f"tienda {i}" for i in range(count)],
+        "nombre_vpn": [f"TIENDA_{i}" for i in range(count)],
+        "ip": [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(count)],
+        "clave_publica": [f"{i:043d}=" for i in range(count)],
+        "clave_privada": [f"{i:043d}=" for i in range(count)],
+    })
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def legacy_excel_update(df, path):
+    """Excel update as netconfig.py/wireguardconfig.py used to do it."""
+    workbook = load_workbook(path)
+    worksheet = workbook.active
+    for index, row in df.iterrows():
+        for column, letter in zip(storage.COLUMNS, "ABCDEFGH"):
+            worksheet[f"{letter}{index + 2}"] = row[column]
+    workbook.save(path)
+
+
+def check_chunks(backend, chunksize=7):
+    """True if reading the backend in batches returns the same DataFrame as read()."""
+    chunked = pd.concat(list(backend.iter_chunks(chunksize)))
+    whole = backend.read()
+    return chunked.equals(whole) and chunked.dtypes.equals(whole.dtypes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    df = make_database(args.rows)
+    print(f"{args.rows} rows")
+    failed = False
+    print(f"{'backend':<10} {'write (s)':>10} {'read (s)':>10} {'size (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for extension in [".csv", ".parquet", ".xlsx"]:
+            path = os.path.join(tmp, "database" + extension)
+            try:
+                backend = storage.get_backend(path)
+            except ImportError as e:
+                print(f"{extension[1:]:<10} skipped ({e})")
+                continue
+            write_time, _ = timed(backend.write, df)
+            read_time, _ = timed(backend.read)
+            size = os.path.getsize(path) / 1e6
+            print(f"{extension[1:]:<10} {write_time:>10.2f} {read_time:>10.2f} {size:>10.1f}")
+
+            # Base sin claves: las ultimas columnas de cada fila quedan vacias
+            unkeyed = os.path.join(tmp, "unkeyed" + extension)
+            storage.save_database(df.head(50).assign(clave_publica=None, clave_privada=None), unkeyed)
+            if not check_chunks(storage.get_backend(unkeyed)):
+                print(f"ERROR: leer {extension[1:]} por lotes no devuelve lo mismo que leerlo entero")
+                failed = True
+
+        # Un .xlsx existente se actualiza en el lugar (conserva formato y otras hojas)
+        update_time, _ = timed(storage.save_database, df, os.path.join(tmp, "database.xlsx"))
+        print(f"{'xlsx (in-place update)':<34} {update_time:.2f} s")
+        legacy_time, _ = timed(legacy_excel_update, df, os.path.join(tmp, "database.xlsx"))
+        print(f"{'xlsx (legacy cell-by-cell update)':<34} {legacy_time:.2f} s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmarks writing and re-reading the peer .conf files.
+
+Compares the old per-row loop (os.path.exists + synchronous write, then
+os.path.exists + line-by-line parse) with tunnels.py (one os.scandir listing,
+thread pool reads and bounded parallel atomic writes). Point --dir at a
+network share to see the effect of per-file latency.
+
+Then times reading the keys back from all the files three ways: the old
+readlines() parser, the bytes regex reader, and a warm, encrypted tunnels.KeyIndex
+(unchanged files are only stat'ed).
+
+Usage: python bench/bench_tunnels.py [--peers 5000] [--workers 8] [--dir PATH]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import tunnels  # noqa: E402
+from keypool import make_cipher  # noqa: E402
+from wgkeys import generate_keys  # noqa: E402
+
+
+def make_peers(count):
+    """Returns (nombre_vpn, private key, ip, subnet) tuples for `count` synthetic peers."""
+    keys = generate_keys(count)
+    return [
+        (f"TIENDA_{i}", private_key, f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", f"10.{i // 65536 % 256}.{i // 256 % 256}.0/24")
+        for i, (private_key, _) in enumerate(keys)
+    ]
+
+
+def legacy_read_peer_config(file_path):
+    """The original line-by-line parser of wireguardconfig.read_peer_config."""
+    with open(file_path, "r") as file:
+        lines = file.readlines()
+    config_data = {}
+    for line in lines:
+        if line.strip().startswith("PrivateKey"):
+            config_data["PrivateKey"] = line.split("=", 1)[-1].strip()
+        elif line.strip().startswith("PublicKey"):
+            config_data["PublicKey"] = line.split("=", 1)[-1].strip()
+    return config_data
+
+
+def legacy(directory, peers, render):
+    for nombre_vpn, private_key, ip, subred in peers:
+        config_file = os.path.join(directory, f"{nombre_vpn}.conf")
+        if os.path.exists(config_file):
+            continue
+        with open(config_file, "w") as outfile:
+            outfile.write(render(private_key=private_key, address=ip, allowed_ips=subred))
+    found = 0
+    for nombre_vpn, _, _, _ in peers:
+        config_file = os.path.join(directory, f"{nombre_vpn}.conf")
+        if os.path.exists(config_file) and legacy_read_peer_config(config_file).get("PrivateKey"):
+            found += 1
+    return found
+
+
+def parallel(directory, peers, render, workers):
+    existing = tunnels.list_configs(directory)
+    files = [
+        (os.path.join(directory, f"{nombre_vpn}.conf"), render(private_key=private_key, address=ip, allowed_ips=subred))
+        for nombre_vpn, private_key, ip, subred in peers
+        if tunnels.config_name(nombre_vpn) not in existing
+    ]
+    tunnels.write_configs(files, workers)
+    existing = tunnels.list_configs(directory)
+    paths = [existing[tunnels.config_name(peer[0])] for peer in peers]
+    return sum(1 for data in tunnels.read_key_pairs(paths, workers).values() if data.get("PrivateKey"))
+
+
+def read_back(directory, workers):
+    """Times the three ways of reading the keys of every .conf in `directory`. Checks they agree."""
+    paths = sorted(tunnels.list_configs(directory).values())
+    index_path = os.path.join(os.path.dirname(directory), "keyindex")
+    cipher = make_cipher(index_path + ".key")
+    # Primera pasada: llena el indice, asi la lectura "index (warm)" solo hace stat de cada archivo
+    index = tunnels.KeyIndex(index_path, cipher)
+    index.read(paths, workers)
+    index.save()
+    modes = [
+        ("readlines", lambda: {path: legacy_read_peer_config(path) for path in paths}),
+        ("bytes regex", lambda: tunnels.read_key_pairs(paths, workers)),
+        ("index (warm)", lambda: tunnels.KeyIndex(index_path, cipher).read(paths, workers)),
+    ]
+    results = []
+    for name, read in modes:
+        start = time.perf_counter()
+        results.append(read())
+        print(f"read {name:<14} {time.perf_counter() - start:>8.3f} s")
+    if any(result != results[0] for result in results):
+        print("ERROR: los lectores devolvieron claves distintas")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=tunnels.DEFAULT_WORKERS)
+    parser.add_argument("--dir", help="base folder for the test files (default: system temp folder)")
+    args = parser.parse_args()
+
+    peers = make_peers(args.peers)
+    render = tunnels.compile_template("ROUTER_PUBLIC_KEY=", "203.0.113.1", "51820")
+    base = tempfile.mkdtemp(dir=args.dir)
+    try:
+        for name, function, extra in [("legacy", legacy, ()), ("parallel", parallel, (args.workers,))]:
+            directory = os.path.join(base, name)
+            os.makedirs(directory)
+            start = time.perf_counter()
+            found = function(directory, peers, render, *extra)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<10} {elapsed:>8.2f} s  ({found} key pairs read back)")
+        read_back(os.path.join(base, "parallel"), args.workers)
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == "__main__":
+    main()
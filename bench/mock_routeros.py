@@ -0,0 +1,134 @@
+"""Local mock of the RouterOS API for tests and benchmarks of src/routeros.py.
+
+Speaks the API wire protocol (length-prefixed words, tagged replies) and
+keeps /ip/address, /ipv6/address and /interface/wireguard/peers in memory.
+Any user and password are accepted. `latency` delays every reply flush, so
+each round trip costs about that much, like a router across a WAN link.
+
+Usage: python bench/mock_routeros.py [--port 8728] [--latency 0.02]
+"""
+import argparse
+import io
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from routeros import encode_sentence, read_sentence  # noqa: E402
+
+MENUS = {
+    "/ip/address": "address",
+    "/ipv6/address": "address",
+    "/interface/wireguard/peers": "public-key",
+}
+
+
+def _split_sentences(buffer):
+    """Returns the complete sentences in `buffer` and the bytes left over."""
+    stream = io.BytesIO(buffer)
+    sentences = []
+    while True:
+        position = stream.tell()
+        try:
+            sentences.append(read_sentence(stream))
+        except ConnectionError:
+            return sentences, buffer[position:]
+
+
+class MockRouter(socketserver.ThreadingTCPServer):
+    """In-memory router: `menus` maps each menu to its list of items (dicts of properties)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0):
+        # Una direccion IPv6 (p. ej. "::1") necesita un socket AF_INET6
+        self.address_family = socket.AF_INET6 if ":" in address[0] else socket.AF_INET
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.menus = {menu: [] for menu in MENUS}
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serves in a daemon thread. Returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def execute(self, words):
+        """Runs one command. Returns the reply sentences (without tag)."""
+        command = words[0]
+        attributes = {}
+        for word in words[1:]:
+            if word.startswith("="):
+                key, _, value = word[1:].partition("=")
+                attributes[key] = value
+        menu, _, action = command.rpartition("/")
+        with self.lock:
+            self.commands += 1
+            if command == "/login":
+                return [["!done"]]
+            if menu not in self.menus:
+                return [["!trap", "=message=no such command prefix"], ["!done"]]
+            items = self.menus[menu]
+            if action == "print":
+                proplist = attributes.get(".proplist")
+                fields = proplist.split(",") if proplist else None
+                replies = [
+                    ["!re", *(f"={key}={value}" for key, value in item.items() if fields is None or key in fields)]
+                    for item in items
+                ]
+                return replies + [["!done"]]
+            if action == "add":
+                unique = MENUS[menu]
+                if any(item.get(unique) == attributes.get(unique) for item in items):
+                    return [["!trap", "=message=failure: already have such entry"], ["!done"]]
+                item_id = f"*{len(items) + 1:X}"
+                items.append({".id": item_id, **attributes})
+                return [["!done", f"=ret={item_id}"]]
+        return [["!trap", "=message=no such command"], ["!done"]]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buffer = b""
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            sentences, buffer = _split_sentences(buffer + data)
+            output = bytearray()
+            for words in sentences:
+                tags = [word for word in words if word.startswith(".tag=")]
+                for reply in self.server.execute([word for word in words if not word.startswith(".tag=")]):
+                    output += encode_sentence(reply + tags)
+            if output:
+                # Una demora por cada tanda de respuestas: simula la latencia de ida y vuelta
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                self.request.sendall(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8728)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every round trip")
+    args = parser.parse_args()
+    router = MockRouter(("127.0.0.1", args.port), args.latency)
+    print(f"RouterOS API simulada en 127.0.0.1:{router.port} (Ctrl+C para salir)")
+    try:
+        router.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Times the whole pipeline on synthetic inventories and compares against a stored baseline.
+
+For every size it generates a database with bench/synth.py, runs the three
+stages in-process (offline; with --key-backend wg the stub in bench/stub/
+stands in for the wg binary) and collects the per-step timings and counters
+of the run report. The best of --repeat runs is kept for every timing.
+The import time of the GUI and CLI entry points (bench/bench_startup.py)
+is measured as well, under "startup".
+
+Results are compared with bench/baseline.json: steps that got slower than
+--tolerance are flagged, and --fail-on-regression makes that an exit code 1.
+--save-baseline overwrites the baseline with this run.
+
+Usage: python bench/run_benchmarks.py [--rows 1000 10000 100000] [--format csv] [--repeat 3]
+"""
+import argparse
+import configparser
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+import storage  # noqa: E402
+from bench_startup import ENTRY_POINTS, heavy_modules, measure  # noqa: E402
+from pipeline import Pipeline  # noqa: E402
+from synth import BASE_NETWORK, SUBNET_PREFIX, make_inventory  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def make_config(database_path, output_path, key_backend):
+    config = configparser.ConfigParser()
+    config.read_dict({
+        "metadata": {"version": "bench"},
+        "netconfig": {
+            "base_network": BASE_NETWORK,
+            "subnet_prefix": str(SUBNET_PREFIX),
+            "database_path": database_path,
+            "default_group_size": "4",
+            "interface": "WG",
+        },
+        "wireguard": {
+            "public_key_custom_text": "8Ak45VAazs/lvrHlu+QZFViblwUjW/7sENIvLXxqZHY=",
+            "endpoint_custom_text": "203.0.113.1",
+            "port_custom_text": "13231",
+            "key_backend": key_backend,
+        },
+        "output": {"output_path": output_path, "incremental": "false"},
+        "mikrotik": {"lookup": "indexed", "chunk_size": "0"},
+    })
+    return config
+
+
+def run_once(df, extension, key_backend):
+    """Runs the pipeline on a copy of `df` in a fresh folder. Returns the run report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "inventory" + extension)
+        storage.save_database(df, database_path)
+        pipeline = Pipeline(make_config(database_path, os.path.join(tmp, "output"), key_backend))
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.run()
+        with open(pipeline.report_path, encoding="utf-8") as file:
+            return json.load(file)
+
+
+def bench_size(rows, args):
+    """Best timings and the counters for one inventory size."""
+    df = make_inventory(rows, args.assigned, args.keyed, seed=args.seed)
+    best = None
+    for _ in range(args.repeat):
+        report = run_once(df, "." + args.format, args.key_backend)
+        if best is None:
+            best = report
+        else:
+            for name, seconds in report["timings"].items():
+                best["timings"][name] = min(best["timings"].get(name, seconds), seconds)
+    return {"timings": best["timings"], "counters": best["counters"]}
+
+
+def bench_startup(args):
+    """Import time of the entry points, in seconds, and how many heavy modules they load."""
+    timings, heavy = {}, 0
+    for module in ENTRY_POINTS:
+        # Los tiempos de importacion son ruidosos: al menos 5 intentos
+        milliseconds, times = measure(module, max(args.repeat, 5))
+        timings[f"import.{module}"] = round(milliseconds / 1000, 6)
+        heavy += len(heavy_modules(times))
+    return {"timings": timings, "counters": {"heavy_modules": heavy}}
+
+
+def compare(results, baseline, tolerance):
+    """Prints every timing next to the baseline. Returns the regressions as (rows, step, ratio)."""
+    regressions = []
+    for rows, result in results.items():
+        previous = baseline.get("results", {}).get(rows, {}).get("timings", {})
+        print(f"\n{rows} rows" if rows.isdigit() else f"\n{rows}")
+        print(f"{'step':<26} {'time (s)':>10} {'baseline':>10} {'ratio':>7}")
+        for name, seconds in result["timings"].items():
+            if name not in previous:
+                print(f"{name:<26} {seconds:>10.4f} {'-':>10} {'-':>7}")
+                continue
+            ratio = seconds / previous[name] if previous[name] > 0 else 1.0
+            # Los pasos muy cortos son ruido: solo se marcan si ademas tardan mas de 10 ms
+            slower = ratio > 1 + tolerance and seconds - previous[name] > 0.01
+            if slower:
+                regressions.append((rows, name, ratio))
+            print(f"{name:<26} {seconds:>10.4f} {previous[name]:>10.4f} {ratio:>6.2f}x" + ("  <-- slower" if slower else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--format", choices=["csv", "parquet", "xlsx"], default="csv", help="database format")
+    parser.add_argument("--assigned", type=float, default=0.5, help="share of clients already assigned")
+    parser.add_argument("--keyed", type=float, default=0.5, help="share of assigned stores that already have keys")
+    parser.add_argument("--key-backend", choices=["native", "wg"], default="native")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    if args.key_backend == "wg":
+        # El stub de bench/stub/ reemplaza al binario wg: no hace falta WireGuard instalado
+        os.environ["PATH"] = os.path.join(BENCH_DIR, "stub") + os.pathsep + os.environ["PATH"]
+
+    results = {str(rows): bench_size(rows, args) for rows in args.rows}
+    results["startup"] = bench_startup(args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if (baseline.get("format"), baseline.get("key_backend")) != (args.format, args.key_backend):
+            print(f"Aviso: el baseline se midio con format={baseline.get('format')} key_backend={baseline.get('key_backend')}")
+    regressions = compare(results, baseline, args.tolerance)
+    if results["startup"]["counters"]["heavy_modules"]:
+        print("\nERROR: la GUI o el CLI importan pandas/openpyxl al iniciar (ver bench/bench_startup.py)")
+        regressions.append(("startup", "heavy_modules", None))
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "format": args.format,
+                "key_backend": args.key_backend,
+                "results": results,
+            }, file, indent=2)
+        print(f"\nBaseline guardado en {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} pasos mas lentos que el baseline (tolerancia {args.tolerance:.0%})")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Generates synthetic MikroGuard inventories for benchmarks.
+
+Each row is a store (punto_de_venta) of a client (razon_social). A share of
+the rows comes already assigned (grupo, subred and ip as the pipeline would
+have left them), a share of those also has keys, and a share of the clients
+uses its own group name instead of GROUPn. Same arguments, same database.
+
+Usage: python bench/synth.py --rows 10000 --output synth.xlsx [--assigned 0.5] [--keyed 0.5] [--clients 500]
+"""
+import argparse
+import base64
+import ipaddress
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pandas as pd  # noqa: E402
+
+import storage  # noqa: E402
+from ipallocator import IPAllocator  # noqa: E402
+from wgkeys import public_key  # noqa: E402
+
+BASE_NETWORK = "10.0.0.0/8"
+SUBNET_PREFIX = 27
+
+
+def make_key(rng):
+    """Returns a (private, public) key pair from the seeded generator."""
+    private_key = base64.b64encode(rng.randbytes(32)).decode("ascii")
+    return private_key, public_key(private_key)
+
+
+def make_inventory(rows, assigned=0.5, keyed=0.5, clients=None, own_groups=0.1, seed=0,
+                   base_network=BASE_NETWORK, subnet_prefix=SUBNET_PREFIX):
+    """Returns a DataFrame with the database columns.
+
+    `assigned` is the share of clients whose stores already have grupo/subred/ip,
+    `keyed` the share of those stores that also have keys, `clients` the number
+    of razon_social values (default: one per 20 stores) and `own_groups` the
+    share of clients with their own group name.
+    """
+    rng = random.Random(seed)
+    clients = clients or max(1, rows // 20)
+    allocator = IPAllocator(ipaddress.IPv4Network(base_network), subnet_prefix)
+
+    # Repartir las tiendas entre los clientes en bloques contiguos, como en una planilla real
+    client_of_row = sorted(rng.randrange(clients) for _ in range(rows))
+    client_assigned = [rng.random() < assigned for _ in range(clients)]
+    client_group = [f"CADENA_{client}" if rng.random() < own_groups else None for client in range(clients)]
+
+    subnets = {}
+    group_counter = 0
+    records = []
+    for row, client in enumerate(client_of_row):
+        record = dict.fromkeys(storage.COLUMNS)
+        record["razon_social"] = f"Cliente {client} S.A."
+        record["punto_de_venta"] = f"Tienda {client}-{row} Centro" if rng.random() < 0.98 else None
+        record["grupo"] = client_group[client]
+        if client_assigned[client]:
+            if client not in subnets:
+                subnets[client] = allocator.allocate_subnet()
+            if record["grupo"] is None:
+                record["grupo"] = f"GROUP{group_counter // 4 + 1}"
+                group_counter += 1
+            record["subred"] = subnets[client]
+            record["ip"] = allocator.allocate_host(subnets[client])
+            if record["ip"] is not None and rng.random() < keyed:
+                record["clave_privada"], record["clave_publica"] = make_key(rng)
+        records.append(record)
+    return pd.DataFrame.from_records(records, columns=storage.COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--assigned", type=float, default=0.5, help="share of clients already assigned")
+    parser.add_argument("--keyed", type=float, default=0.5, help="share of assigned stores that already have keys")
+    parser.add_argument("--clients", type=int, default=None, help="number of razon_social values")
+    parser.add_argument("--own-groups", type=float, default=0.1, help="share of clients with their own group")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="database to write (.xlsx, .csv or .parquet)")
+    args = parser.parse_args()
+
+    df = make_inventory(args.rows, args.assigned, args.keyed, args.clients, args.own_groups, args.seed)
+    storage.save_database(df, args.output)
+    print(f"{len(df)} filas escritas en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
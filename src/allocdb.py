@@ -0,0 +1,286 @@
+"""Persistent allocation index: clients, subnets, peers and keys in an SQLite file.
+
+Enabled with `allocation_db` in [netconfig]. The database is the source of
+truth for what was handed out: values found in the Excel/CSV are imported
+into it, new subnets and IPs are allocated with indexed queries and inserted
+in the same transaction, and the spreadsheet is written back as a view.
+Every allocation runs inside BEGIN IMMEDIATE, so concurrent runs against the
+same file wait for each other instead of handing out the same address.
+
+Usage: python src/allocdb.py export --db allocations.sqlite --output peers.csv
+"""
+import argparse
+import ipaddress
+import os
+import sqlite3
+from contextlib import contextmanager
+from ipallocator import _HostPool, _int_to_ip, _ip_to_int, _is_missing
+
+# Las direcciones se guardan como enteros en hexadecimal de 32 digitos: ordenan igual que los
+# numeros y sirven tanto para IPv4 como para IPv6 (que no entra en un INTEGER de SQLite)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    name TEXT NOT NULL,
+    family INTEGER NOT NULL,
+    subnet TEXT NOT NULL,
+    PRIMARY KEY (name, family)
+);
+CREATE TABLE IF NOT EXISTS subnets (
+    network_key TEXT PRIMARY KEY,
+    network TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS peers (
+    ip_key TEXT PRIMARY KEY,
+    ip TEXT NOT NULL UNIQUE,
+    subnet TEXT,
+    nombre_vpn TEXT
+);
+CREATE INDEX IF NOT EXISTS peers_subnet ON peers (subnet);
+CREATE TABLE IF NOT EXISTS keys (
+    public_key TEXT PRIMARY KEY,
+    private_key TEXT NOT NULL,
+    ip_key TEXT NOT NULL UNIQUE REFERENCES peers (ip_key)
+);
+"""
+
+# Segundos que una ejecucion espera a que otra libere la base de datos
+LOCK_TIMEOUT = 300
+
+
+def _key(value):
+    return f"{value:032x}"
+
+
+def _network(value):
+    """Parses a subnet cell. Returns None for empty or invalid values."""
+    if _is_missing(value):
+        return None
+    try:
+        return ipaddress.ip_network(str(value).strip(), strict=False)
+    except ValueError:
+        return None
+
+
+def _ip(value):
+    """Parses an IP cell to (key, text). Returns None for empty or invalid values."""
+    if _is_missing(value):
+        return None
+    text = str(value).strip()
+    try:
+        return _key(_ip_to_int(text)), text
+    except ValueError:
+        return None
+
+
+class AllocationStore:
+    """SQLite file with the clients, subnets, peers and keys handed out so far."""
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self._last_key = None  # Con freeze_keys(): ultimo rowid de keys visible para keys_for_ips
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """Holds the write lock for the whole block. Commits at the end, rolls back on error."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def import_clients(self, subnets_by_client, family=4):
+        """Records (client, subnet) pairs from the spreadsheet. Clients already in the database keep their subnet."""
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO clients VALUES (?, ?, ?)",
+            ((str(name), family, str(subnet)) for name, subnet in subnets_by_client),
+        )
+
+    def import_addresses(self, df, subnet_column="subred", ip_column="ip"):
+        """Records the subnets and IPs of the spreadsheet rows (a batch of rows in chunked runs)."""
+        subnets = {}
+        for value in set(df[subnet_column]):
+            network = _network(value)
+            if network is not None:
+                subnets[_key(int(network.network_address))] = str(network)
+        self.connection.executemany("INSERT OR IGNORE INTO subnets VALUES (?, ?)", subnets.items())
+
+        peers = []
+        for ip, subred in zip(df[ip_column], df[subnet_column]):
+            parsed = _ip(ip)
+            if parsed is not None:
+                peers.append((*parsed, None if _is_missing(subred) else str(subred)))
+        self.connection.executemany("INSERT OR IGNORE INTO peers (ip_key, ip, subnet) VALUES (?, ?, ?)", peers)
+
+    def client_subnets(self, names, family=4):
+        """Returns {client: subnet} for the given clients that already have a subnet of that IP family."""
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (name TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM wanted")
+        # Los nombres se guardan como texto; se devuelven con el valor original de la planilla
+        by_text = {str(name): name for name in names}
+        self.connection.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((name,) for name in by_text))
+        rows = self.connection.execute(
+            "SELECT clients.name, clients.subnet FROM clients JOIN wanted USING (name) WHERE clients.family = ?", (family,)
+        )
+        return {by_text[name]: subnet for name, subnet in rows}
+
+    def save_client_subnets(self, subnets_by_client, family=4):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO clients VALUES (?, ?, ?)",
+            ((str(name), family, subnet) for name, subnet in subnets_by_client.items()),
+        )
+
+    def allocator(self, base_network, subnet_prefix):
+        """Returns an allocator backed by this database (use it inside `transaction()`)."""
+        return SQLiteAllocator(self, base_network, subnet_prefix)
+
+    def freeze_keys(self):
+        """Makes keys_for_ips ignore the keys stored from now on.
+
+        A chunked run saves the keys of each batch before reading the next
+        one; like a run in one piece, it must only find the keys stored before it started.
+        """
+        self._last_key = self.connection.execute("SELECT coalesce(max(rowid), 0) FROM keys").fetchone()[0]
+
+    def keys_for_ips(self, ips):
+        """Returns {ip: (private key, public key)} for the given IPs that have keys in the database."""
+        found = {}
+        query = "SELECT private_key, public_key FROM keys WHERE ip_key = ?"
+        parameters = ()
+        if self._last_key is not None:
+            query += " AND rowid <= ?"
+            parameters = (self._last_key,)
+        for ip in ips:
+            parsed = _ip(ip)
+            if parsed is not None:
+                row = self.connection.execute(query, (parsed[0], *parameters)).fetchone()
+                if row is not None:
+                    found[ip] = row
+        return found
+
+    def save_peers(self, df):
+        """Stores the VPN name and keys of every row with an IP (the spreadsheet export, in reverse)."""
+        peers, keys = [], []
+        for ip, subred, nombre_vpn, public_key, private_key in zip(
+            df["ip"], df["subred"], df["nombre_vpn"], df["clave_publica"], df["clave_privada"]
+        ):
+            parsed = _ip(ip)
+            if parsed is None:
+                continue
+            peers.append((*parsed, None if _is_missing(subred) else str(subred), None if _is_missing(nombre_vpn) else str(nombre_vpn)))
+            if not _is_missing(public_key) and not _is_missing(private_key):
+                keys.append((str(public_key), str(private_key), parsed[0]))
+        self.connection.executemany(
+            "INSERT INTO peers VALUES (?, ?, ?, ?) ON CONFLICT (ip_key) DO UPDATE SET "
+            "subnet = excluded.subnet, nombre_vpn = excluded.nombre_vpn",
+            peers,
+        )
+        # Una clave publica repetida o una IP que ya tiene clave no reemplazan lo guardado
+        self.connection.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?, ?)", keys)
+
+    def export_rows(self):
+        """Yields (subred, nombre_vpn, ip, clave_publica, clave_privada) for every peer, in IP order."""
+        return self.connection.execute(
+            "SELECT peers.subnet, peers.nombre_vpn, peers.ip, keys.public_key, keys.private_key "
+            "FROM peers LEFT JOIN keys USING (ip_key) ORDER BY peers.ip_key"
+        )
+
+
+class SQLiteAllocator:
+    """Same interface as IPAllocator, with the used subnets and IPs read from the database.
+
+    Only the rows in the range being allocated are queried: the next free
+    subnet walks the subnets index from a cursor, and the first use of a
+    subnet reads the IPs inside it with one range query on the peers key.
+    """
+
+    def __init__(self, store, base_network, subnet_prefix):
+        self.connection = store.connection
+        self.base_network = ipaddress.ip_network(base_network)
+        self.subnet_prefix = int(subnet_prefix)
+        if not self.base_network.prefixlen <= self.subnet_prefix <= self.base_network.max_prefixlen:
+            raise ValueError(f"Prefijo de subred /{self.subnet_prefix} invalido para {self.base_network}.")
+        self._step = 1 << (self.base_network.max_prefixlen - self.subnet_prefix)
+        self._subnet_cursor = int(self.base_network.network_address)
+        self._last = int(self.base_network.broadcast_address)
+        self._pools = {}  # Texto de la subred -> (_HostPool, IPs usadas)
+
+    def allocate_subnet(self):
+        """Returns the lowest free subnet of the base network and records it."""
+        cursor = self._subnet_cursor
+        used = self.connection.execute(
+            "SELECT network_key FROM subnets WHERE network_key >= ? AND network_key <= ? ORDER BY network_key",
+            (_key(cursor), _key(self._last)),
+        )
+        for (network_key,) in used:
+            value = int(network_key, 16)
+            if value > cursor:
+                break
+            if value == cursor:
+                cursor += self._step
+        if cursor > self._last:
+            raise ValueError("No hay mas subredes disponibles para asignar.")
+        subnet = f"{_int_to_ip(cursor, self.base_network.version)}/{self.subnet_prefix}"
+        self.connection.execute("INSERT INTO subnets VALUES (?, ?)", (_key(cursor), subnet))
+        self._subnet_cursor = cursor + self._step
+        return subnet
+
+    def _pool(self, subnet):
+        entry = self._pools.get(subnet)
+        if entry is None:
+            pool = _HostPool(ipaddress.ip_network(str(subnet).strip(), strict=False))
+            used = {
+                int(ip_key, 16) for (ip_key,) in self.connection.execute(
+                    "SELECT ip_key FROM peers WHERE ip_key BETWEEN ? AND ?", (_key(pool.first), _key(pool.last))
+                )
+            }
+            entry = self._pools[subnet] = (pool, used)
+        return entry
+
+    def allocate_host(self, subnet):
+        """Returns the lowest free host IP of `subnet` and records it, or None if the subnet is full."""
+        pool, used = self._pool(subnet)
+        cursor = pool.cursor
+        while cursor <= pool.last and cursor in used:
+            cursor += 1
+        pool.cursor = cursor
+        if cursor > pool.last:
+            return None
+        used.add(cursor)
+        ip = _int_to_ip(cursor, pool.version)
+        self.connection.execute("INSERT INTO peers (ip_key, ip, subnet) VALUES (?, ?, ?)", (_key(cursor), ip, str(subnet)))
+        return ip
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports the allocation database as a CSV view.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export = subcommands.add_parser("export", help="write every peer with its subnet and keys to a CSV file")
+    export.add_argument("--db", required=True)
+    export.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    import csv
+
+    with AllocationStore(args.db) as store, open(args.output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["subred", "nombre_vpn", "ip", "clave_publica", "clave_privada"])
+        writer.writerows(store.export_rows())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Tunnel exports in bulk: every peer config in one zip/tar archive, and QR codes for mobile clients.
+
+With `tunnels_format = zip` or `tar` in [output] the WireGuard stage streams
+all the .conf files into output/tunnels.zip (or tunnels.tar.gz) in one pass
+instead of writing one file per peer. `bundle_groups = grupo` or
+`razon_social` puts each peer in a subfolder of its group or client.
+
+`qr_codes = png` writes one QR code per peer to output/qr/ (same subfolders)
+and `qr_codes = pdf` printable sheets, output/qr/tunnels_qr.pdf, with a
+grid of labelled codes per page. QR codes need the `qrcode` package with
+Pillow and are rendered in a process pool.
+"""
+import io
+import itertools
+import os
+import re
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fsutil import replacing, replacing_directory
+
+FORMATS = {"zip": "tunnels.zip", "tar": "tunnels.tar.gz"}
+
+# Hoja del PDF: A4 a 150 ppp, 3 x 4 codigos por pagina, hasta 100 paginas por archivo
+PAGE_SIZE = (1240, 1754)
+GRID = (3, 4)
+SHEET_PAGES = 100
+QR_BATCH = 64
+
+_UNSAFE = re.compile(r'[<>:"/\\|?*\x00-\x1f]+')
+
+
+def export_options(settings):
+    """Returns (tunnels_format, bundle_groups or None, qr_codes or None) from [output]."""
+    groups, qr_codes = settings.bundle_groups, settings.qr_codes
+    return settings.tunnels_format, None if groups == "none" else groups, None if qr_codes == "none" else qr_codes
+
+
+def folder_name(value):
+    """Turns a group or client name into a folder name that is valid on Windows and in archives."""
+    if value is None or value != value or not str(value).strip():
+        return "sin_grupo"
+    return _UNSAFE.sub("_", str(value).strip()).rstrip(". ") or "sin_grupo"
+
+
+def member_name(nombre_vpn, group=None, extension=".conf"):
+    """Path of a peer inside the archive or the QR folder (always with "/"). Named like its .conf file."""
+    name = _UNSAFE.sub("_", f"{nombre_vpn}{extension}")
+    return name if group is None else f"{folder_name(group)}/{name}"
+
+
+def bundle_path(output_path, tunnels_format):
+    return os.path.join(output_path, FORMATS[tunnels_format])
+
+
+def write_bundle(path, entries, tunnels_format):
+    """Streams (member name, text) entries into a zip or tar.gz archive. Returns (files, bytes).
+
+    The archive is built in a temporary file and moved over `path` at the end,
+    so a failed run never leaves a half-written archive behind.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    files = size = 0
+    with replacing(path) as tmp_path, open(tmp_path, "wb") as file:
+        if tunnels_format == "zip":
+            with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for name, text in entries:
+                    data = text.encode("utf-8")
+                    archive.writestr(name, data)
+                    files, size = files + 1, size + len(data)
+        else:
+            now = time.time()
+            with tarfile.open(fileobj=file, mode="w:gz") as archive:
+                for name, text in entries:
+                    data = text.encode("utf-8")
+                    info = tarfile.TarInfo(name)
+                    info.size, info.mtime, info.mode = len(data), now, 0o600
+                    archive.addfile(info, io.BytesIO(data))
+                    files, size = files + 1, size + len(data)
+    return files, size
+
+
+def _qr_images(batch):
+    """Renders a batch of (name, text) as PNG bytes. Runs in a worker process."""
+    import qrcode
+
+    images = []
+    for name, text in batch:
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=6, border=2)
+        qr.add_data(text)
+        qr.make(fit=True)
+        buffer = io.BytesIO()
+        qr.make_image().save(buffer, format="PNG")
+        images.append((name, buffer.getvalue()))
+    return images
+
+
+def render_qr_codes(entries, workers=None):
+    """Renders (name, text) entries to PNG bytes in a process pool. Yields (name, PNG bytes) in order.
+
+    Entries are read in batches as the codes are consumed, with a few batches
+    per worker in flight, so a large export is never held in memory at once.
+    """
+    try:
+        import qrcode  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Los codigos QR requieren los paquetes qrcode y pillow (pip install qrcode pillow).") from None
+    entries = iter(entries)
+    batches = iter(lambda: list(itertools.islice(entries, QR_BATCH)), [])
+    first, second = next(batches, None), next(batches, None)
+    if second is None:
+        # Pocos codigos: no vale la pena arrancar procesos
+        if first is not None:
+            yield from _qr_images(first)
+        return
+    in_flight = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque([executor.submit(_qr_images, first), executor.submit(_qr_images, second)])
+        for batch in batches:
+            if len(pending) >= in_flight:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_qr_images, batch))
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_qr_pngs(directory, images):
+    """Writes one PNG per peer under `directory`. Returns the number of files."""
+    written = 0
+    for name, png in images:
+        path = os.path.join(directory, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(png)
+        written += 1
+    return written
+
+
+def _sheet_pages(images):
+    """Lays the QR codes out in a grid with their names. Yields one black and white page at a time."""
+    from PIL import Image, ImageDraw
+
+    columns, rows = GRID
+    cell_width, cell_height = PAGE_SIZE[0] // columns, PAGE_SIZE[1] // rows
+    page = None
+    for position, (name, png) in enumerate(images):
+        slot = position % (columns * rows)
+        if slot == 0:
+            if page is not None:
+                yield page
+            page = Image.new("1", PAGE_SIZE, 1)
+            draw = ImageDraw.Draw(page)
+        qr = Image.open(io.BytesIO(png)).convert("1")
+        qr.thumbnail((cell_width - 40, cell_height - 60))
+        x = (slot % columns) * cell_width + (cell_width - qr.width) // 2
+        y = (slot // columns) * cell_height + 20
+        page.paste(qr, (x, y))
+        draw.text((x, y + qr.height + 8), os.path.splitext(name)[0], fill=0)
+    if page is not None:
+        yield page
+
+
+def write_qr_sheets(directory, images):
+    """Saves the QR codes as printable PDF sheets. Returns the number of codes.
+
+    Pillow keeps every page of a PDF in memory until it is saved, so the
+    sheets are split into files of SHEET_PAGES pages: tunnels_qr.pdf, or
+    tunnels_qr_001.pdf, tunnels_qr_002.pdf, ... for large batches.
+    """
+    os.makedirs(directory, exist_ok=True)
+    single = os.path.join(directory, "tunnels_qr.pdf")
+    pages = []
+    files = 0
+    codes = 0
+
+    def counted(images):
+        nonlocal codes
+        for image in images:
+            codes += 1
+            yield image
+
+    def save():
+        nonlocal files
+        files += 1
+        if files == 2:
+            # Hace falta mas de un archivo: el primero pasa a ser el 001
+            os.replace(single, os.path.join(directory, "tunnels_qr_001.pdf"))
+        path = single if files == 1 else os.path.join(directory, f"tunnels_qr_{files:03d}.pdf")
+        pages[0].save(path, format="PDF", save_all=True, append_images=pages[1:], resolution=150)
+        pages.clear()
+
+    for page in _sheet_pages(counted(images)):
+        pages.append(page)
+        if len(pages) == SHEET_PAGES:
+            save()
+    if pages:
+        save()
+    return codes
+
+
+def write_qr_codes(output_path, entries, qr_codes, workers=None):
+    """Writes the QR codes of (name, text) entries as PNG files or PDF sheets. Returns the number of codes.
+
+    The codes are written to a new folder that replaces output/qr at the end,
+    so codes of peers removed since the last run, or sheet files left over
+    when there are fewer sheets, are never handed out.
+    """
+    images = render_qr_codes(entries, workers)
+    with replacing_directory(os.path.join(output_path, "qr")) as directory:
+        if qr_codes == "pdf":
+            return write_qr_sheets(directory, images)
+        return write_qr_pngs(directory, images)
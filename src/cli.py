@@ -0,0 +1,187 @@
+"""Headless command line for MikroGuard.
+
+Runs the whole pipeline without the GUI, for one or many tenants:
+
+    python src/mikroguard.py --config tenants/a.ini --config tenants/b.ini
+    python src/mikroguard.py --config src/config.ini --database db/a.xlsx --database db/b.xlsx --output out/
+
+Each config/database pair is a job. Jobs run concurrently in a process pool.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from settings import CONFIG_PATH, ConfigError, load_config, validate
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="mikroguard",
+        description="Generates WireGuard peers and MikroTik scripts without the GUI, for one or many tenants.",
+    )
+    parser.add_argument(
+        "--config", action="append", default=[],
+        help=f"config.ini of a tenant. Repeat for several tenants (default: {CONFIG_PATH})",
+    )
+    parser.add_argument(
+        "--database", action="append", default=[],
+        help="Database (.xlsx/.csv/.parquet) that overrides database_path. Repeat for several tenants",
+    )
+    parser.add_argument(
+        "--output", action="append", default=[],
+        help="Output folder that overrides output_path. Given once for several jobs, each job gets a subfolder",
+    )
+    parser.add_argument("--jobs", type=int, default=None, help="Jobs run at the same time (default: CPU count)")
+    parser.add_argument(
+        "--incremental", action=argparse.BooleanOptionalAction, default=None,
+        help="Only write files for new or changed rows (default: incremental in [output])",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="Split the MikroTik scripts into files of at most this many entries (default: chunk_size in [mikrotik])",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Profile each run with cProfile and write a .pstats file next to its JSON report (output/reports/)",
+    )
+    return parser
+
+
+def _broadcast(values, count, option):
+    """Repeats a single value for every job, or checks that there is one value per job."""
+    if not values:
+        return [None] * count
+    if len(values) == 1:
+        return values * count
+    if len(values) != count:
+        raise SystemExit(f"mikroguard: error: {option} se dio {len(values)} veces pero hay {count} trabajos")
+    return values
+
+
+def job_name(config_path, database_path):
+    """Name of a job, used for its output subfolder and in the summary."""
+    return os.path.splitext(os.path.basename(database_path or config_path))[0]
+
+
+def plan_jobs(args):
+    """Turns the command line options into a list of job dicts."""
+    configs = args.config or [CONFIG_PATH]
+    count = max(len(configs), len(args.database), 1)
+    configs = _broadcast(configs, count, "--config")
+    databases = _broadcast(args.database, count, "--database")
+    outputs = _broadcast(args.output, count, "--output")
+
+    jobs = []
+    for config_path, database_path, output_path in zip(configs, databases, outputs):
+        name = job_name(config_path, database_path)
+        # Una sola carpeta de salida para varios trabajos: un subdirectorio por trabajo
+        if output_path is not None and count > 1 and len(args.output) == 1:
+            output_path = os.path.join(output_path, name)
+        jobs.append({
+            "name": name,
+            "config_path": config_path,
+            "database_path": database_path,
+            "output_path": output_path,
+            "incremental": args.incremental,
+            "chunk_size": args.chunk_size,
+            "profile": args.profile,
+        })
+
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names) and len(args.output) <= 1:
+        raise SystemExit("mikroguard: error: hay trabajos con el mismo nombre; use un --output por trabajo")
+    return jobs
+
+
+def job_config(job):
+    """Reads the job's config.ini and applies the command line overrides."""
+    if not os.path.exists(job["config_path"]):
+        raise FileNotFoundError(f"No se encontro el archivo de configuracion {job['config_path']}.")
+    config = load_config(job["config_path"])
+    for section, option, value in [
+        ("netconfig", "database_path", job["database_path"]),
+        ("output", "output_path", job["output_path"]),
+        ("mikrotik", "chunk_size", job["chunk_size"]),
+    ]:
+        if value is not None:
+            if not config.has_section(section):
+                config.add_section(section)
+            config[section][option] = str(value)
+    return config
+
+
+def check_jobs(jobs):
+    """Validates the config of every job before any of them starts. Returns the number of invalid jobs."""
+    invalid = 0
+    for job in jobs:
+        try:
+            validate(job_config(job))
+        except (ConfigError, FileNotFoundError) as e:
+            print(f"[{job['name']}] ERROR: {e}", file=sys.stderr)
+            invalid += 1
+    return invalid
+
+
+def run_job(job):
+    """Runs the pipeline for one job. Executed in a worker process.
+
+    Returns (name, rows, seconds, captured output). Exceptions propagate to the parent.
+    """
+    # Importar aqui: el proceso principal solo planifica y no necesita pandas
+    from pipeline import Pipeline
+
+    pipeline = Pipeline(job_config(job), incremental=job["incremental"], profile=job["profile"])
+    for directory in [os.path.dirname(pipeline.settings.database_path), pipeline.settings.output_path]:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        pipeline.run()
+    if pipeline.report_path:
+        log.write(f"Reporte de ejecucion: {pipeline.report_path}\n")
+    return job["name"], pipeline.rows, time.perf_counter() - start, log.getvalue()
+
+
+def run_jobs(jobs, workers=None):
+    """Runs the jobs in a process pool. Returns the number of failed jobs."""
+    if len(jobs) == 1:
+        # Un solo trabajo: ejecutarlo en este proceso
+        results = [_collect(jobs[0], lambda: run_job(jobs[0]))]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_job, job): job for job in jobs}
+            results = [_collect(futures[future], future.result) for future in as_completed(futures)]
+    return sum(1 for ok in results if not ok)
+
+
+def _collect(job, result):
+    """Prints the outcome of a job. Returns False if it failed."""
+    try:
+        name, rows, elapsed, log = result()
+    except Exception as e:
+        print(f"[{job['name']}] ERROR: {e}", file=sys.stderr)
+        return False
+    sys.stdout.write("".join(f"[{name}] {line}\n" for line in log.splitlines()))
+    print(f"[{name}] OK: {rows} filas en {elapsed:.2f} s")
+    return True
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    jobs = plan_jobs(args)
+    # Un error de configuracion se informa en milisegundos, sin lanzar ningun trabajo
+    if check_jobs(jobs):
+        return 1
+    failed = run_jobs(jobs, args.jobs)
+    if len(jobs) > 1:
+        print(f"{len(jobs) - failed}/{len(jobs)} trabajos completados")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
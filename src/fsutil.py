@@ -0,0 +1,135 @@
+import os
+import secrets
+import shutil
+import time
+from contextlib import ExitStack, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(TimeoutError):
+    """Another process held a lock for longer than the timeout."""
+
+
+def atomic_write(path, text, encoding="utf-8", mode=0o666):
+    """Writes a text file through a temporary file in the same folder and renames it into place.
+
+    Readers see either the old file or the complete new one, never a half-written file.
+    The permissions are the same as with replacing().
+    """
+    with replacing(path, mode) as tmp_path, open(tmp_path, "w", encoding=encoding) as file:
+        file.write(text)
+
+
+@contextmanager
+def replacing(path, mode=0o666):
+    """Yields a temporary path next to `path` and renames it over `path` when the block succeeds.
+
+    For files written piece by piece (e.g. a database written in batches of
+    rows): if the block fails, the temporary file is removed and `path` is
+    left as it was. A new file gets `mode` minus the umask, like open() would
+    create it; an existing file keeps its permissions.
+    """
+    directory = os.path.dirname(path) or "."
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{secrets.token_hex(4)}.tmp")
+    os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode))
+    try:
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Si algo falla no dejar el temporal en la carpeta de salida
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def replacing_directory(path):
+    """Yields a new temporary folder next to `path` that replaces the folder `path` when the block succeeds.
+
+    For folders rebuilt whole on every run: files of the old folder that the
+    block does not write again are gone afterwards. If the block fails, the
+    temporary folder is removed and `path` is left as it was.
+    """
+    parent, name = os.path.split(os.path.normpath(path))
+    os.makedirs(parent or ".", exist_ok=True)
+    tmp_path = os.path.join(parent, f".{name}.{secrets.token_hex(4)}.tmp")
+    os.mkdir(tmp_path)
+    try:
+        yield tmp_path
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    # Una carpeta no se puede reemplazar con os.replace si no esta vacia: apartar la anterior y borrarla despues
+    old_path = os.path.join(parent, f".{name}.{secrets.token_hex(4)}.old")
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def lock_path(path):
+    """Lock file used for `path`: hidden, next to it (e.g. db/.default.xlsx.lock)."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.lock")
+
+
+def _try_lock(file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, timeout=None, poll=0.1):
+    """Holds an exclusive advisory lock on the file `path` (created if missing) for the block.
+
+    Other processes, and other threads with their own file_lock, wait for
+    it; after `timeout` seconds (None: forever) LockTimeout is raised. The
+    lock is released by the operating system if the process dies, and the
+    lock file itself is left in place.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as file:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting = False
+        while not _try_lock(file):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockTimeout(f"Otra ejecucion sigue usando {path} despues de {timeout} s.")
+            if not waiting:
+                print(f"Esperando a que termine otra ejecucion ({path})...")
+                waiting = True
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            _unlock(file)
+
+
+@contextmanager
+def file_locks(paths, timeout=None):
+    """Holds file_lock on every path. They are taken in sorted order, so two runs never wait on each other in a cycle."""
+    with ExitStack() as stack:
+        for path in sorted(set(os.path.abspath(path) for path in paths)):
+            stack.enter_context(file_lock(path, timeout))
+        yield
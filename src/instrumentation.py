@@ -0,0 +1,104 @@
+import cProfile
+import itertools
+import json
+import os
+import platform
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from fsutil import atomic_write
+
+# Numero de ejecucion dentro del proceso: los workers del CLI ejecutan varios trabajos cada uno
+_runs = itertools.count(1)
+
+
+class Recorder:
+    """Collects the timings (seconds, added up per name) and counters of one run."""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.run_id = f"{os.getpid()}-{next(_runs)}"
+        self.timings = {}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            "counters": dict(self.counters),
+        }
+
+
+# Recorder de la ejecucion en curso. Sin recorder activo timer() y count() no hacen nada,
+# asi los scripts sueltos (netconfig.py, ...) no pagan nada por la instrumentacion
+_active = None
+
+
+def timer(name):
+    """Times a block under `name` in the active recorder, if any."""
+    return nullcontext() if _active is None else _active.timer(name)
+
+
+def count(name, value=1):
+    """Adds `value` to the counter `name` of the active recorder, if any."""
+    if _active is not None:
+        _active.count(name, value)
+
+
+@contextmanager
+def recording(recorder):
+    """Makes `recorder` the active recorder inside the block."""
+    global _active
+    previous, _active = _active, recorder
+    try:
+        yield recorder
+    finally:
+        _active = previous
+
+
+@contextmanager
+def profiled(stats_path=None):
+    """Runs the block under cProfile and writes pstats data to `stats_path`. No-op without a path."""
+    if stats_path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(stats_path) or ".", exist_ok=True)
+        profiler.dump_stats(stats_path)
+
+
+def report_stem(recorder):
+    """File name (without extension) shared by the JSON report and the pstats file of a run.
+
+    The process id and run number keep runs that start in the same second from overwriting each other's report.
+    """
+    return f"run_{recorder.started.strftime('%Y%m%d-%H%M%S')}_{recorder.run_id}"
+
+
+def write_report(path, recorder, **info):
+    """Writes the JSON run report: `info` plus the environment, timings and counters."""
+    report = {
+        **info,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **recorder.to_dict(),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atomic_write(path, json.dumps(report, indent=2))
+    return path
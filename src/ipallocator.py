@@ -0,0 +1,130 @@
+import ipaddress
+import socket
+
+
+def _ip_to_int(text):
+    """Parses an IP address to an integer (fast path for dotted-quad IPv4)."""
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big")
+    except OSError:
+        return int(ipaddress.ip_address(text))
+
+
+def _int_to_ip(value, version=4):
+    """Formats an integer IP address as text."""
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+    return str(ipaddress.IPv6Address(value))
+
+
+def _is_missing(value):
+    """True for empty cells (None, NaN or blank strings)."""
+    return value is None or value != value or (isinstance(value, str) and not value.strip())
+
+
+class _HostPool:
+    """Host range of a subnet as integers, with a cursor to its lowest free address."""
+
+    __slots__ = ("first", "last", "cursor", "version")
+
+    def __init__(self, network):
+        first = int(network.network_address)
+        last = int(network.broadcast_address)
+        # Igual que network.hosts(): sin direccion de red ni broadcast salvo en /31 y /32
+        if network.max_prefixlen - network.prefixlen >= 2:
+            first += 1
+            last -= 1
+        self.first = first
+        self.last = last
+        self.cursor = first
+        self.version = network.version
+
+
+class IPAllocator:
+    """Hands out subnets of a base network and host IPs inside them.
+
+    Addresses are stored as integers. Subnets are tracked as indexes inside
+    the base network and every subnet keeps a cursor to its lowest free host,
+    so each allocation is amortized O(1) instead of a rescan from the start.
+    """
+
+    def __init__(self, base_network, subnet_prefix):
+        self.base_network = ipaddress.ip_network(base_network)
+        self.subnet_prefix = int(subnet_prefix)
+        if not self.base_network.prefixlen <= self.subnet_prefix <= self.base_network.max_prefixlen:
+            raise ValueError(f"Prefijo de subred /{self.subnet_prefix} invalido para {self.base_network}.")
+
+        self._base = int(self.base_network.network_address)
+        self._subnet_shift = self.base_network.max_prefixlen - self.subnet_prefix
+        self._subnet_count = 1 << (self.subnet_prefix - self.base_network.prefixlen)
+        self._subnet_cursor = 0
+        self._used_subnets = set()  # Indices de subred ocupados dentro de base_network
+        self._used_ips = set()  # Direcciones ocupadas como enteros
+        self._pools = {}  # Texto de la subred -> _HostPool
+
+    @classmethod
+    def from_columns(cls, base_network, subnet_prefix, subnets=(), ips=()):
+        """Builds an allocator seeded with the values of the `subred` and `ip` columns."""
+        allocator = cls(base_network, subnet_prefix)
+        allocator.mark_columns(subnets, ips)
+        return allocator
+
+    def mark_columns(self, subnets=(), ips=()):
+        """Marks the values of a `subred` and an `ip` column as used. Can be called once per batch of rows."""
+        # Cada subred se repite en muchas filas: se procesa una sola vez.
+        # Los valores que no son direcciones validas se ignoran, como antes.
+        for subnet in set(subnets):
+            if not _is_missing(subnet):
+                try:
+                    self.mark_subnet(subnet)
+                except ValueError:
+                    continue
+        for ip in ips:
+            if not _is_missing(ip):
+                try:
+                    self.mark_ip(ip)
+                except ValueError:
+                    continue
+
+    def mark_subnet(self, subnet):
+        """Marks a subnet as used. Subnets outside the base network are ignored."""
+        network = ipaddress.ip_network(str(subnet).strip(), strict=False)
+        if network.version != self.base_network.version or network.prefixlen != self.subnet_prefix:
+            return
+        index = (int(network.network_address) - self._base) >> self._subnet_shift
+        if 0 <= index < self._subnet_count:
+            self._used_subnets.add(index)
+
+    def mark_ip(self, ip):
+        """Marks a host address as used."""
+        self._used_ips.add(_ip_to_int(str(ip).strip()))
+
+    def allocate_subnet(self):
+        """Returns the lowest free subnet of the base network as text (e.g. "10.0.0.32/27")."""
+        while self._subnet_cursor in self._used_subnets:
+            self._subnet_cursor += 1
+        if self._subnet_cursor >= self._subnet_count:
+            raise ValueError("No hay mas subredes disponibles para asignar.")
+        index = self._subnet_cursor
+        self._used_subnets.add(index)
+        address = self._base + (index << self._subnet_shift)
+        return f"{_int_to_ip(address, self.base_network.version)}/{self.subnet_prefix}"
+
+    def _pool(self, subnet):
+        pool = self._pools.get(subnet)
+        if pool is None:
+            pool = self._pools[subnet] = _HostPool(ipaddress.ip_network(str(subnet).strip(), strict=False))
+        return pool
+
+    def allocate_host(self, subnet):
+        """Returns the lowest free host IP of `subnet` as text, or None if the subnet is full."""
+        pool = self._pool(subnet)
+        used_ips = self._used_ips
+        cursor = pool.cursor
+        while cursor <= pool.last and cursor in used_ips:
+            cursor += 1
+        pool.cursor = cursor
+        if cursor > pool.last:
+            return None
+        used_ips.add(cursor)
+        return _int_to_ip(cursor, pool.version)
@@ -0,0 +1,247 @@
+"""Pool of pre-generated WireGuard key pairs, encrypted at rest.
+
+Enabled with `key_pool` in [wireguard]. The pool file holds up to
+`key_pool_size` key pairs (raw 32-byte private + public keys), one
+fixed-size line per pair, each encrypted with Fernet from the
+`cryptography` package. The encryption key is read from the
+MIKROGUARD_POOL_KEY environment variable, or from `<pool>.key` (created on
+first use, readable only by its owner) when the variable is not set. With
+`key_pool_encrypt = false` the lines are plain base64.
+
+The WireGuard stage draws keys from the end of the file and only generates
+the ones the pool cannot cover, so a draw reads and truncates just the
+lines it takes. refill() tops the pool up in a process pool; the GUI runs
+it in the background while the config is being edited.
+
+Usage: python src/keypool.py fill [--size 10000] | python src/keypool.py status
+"""
+import argparse
+import base64
+import dataclasses
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from fsutil import file_lock, lock_path
+from settings import load_config, validate
+from wgkeys import get_key_generator
+
+KEY_ENV = "MIKROGUARD_POOL_KEY"
+PAIR_SIZE = 64  # 32 bytes de clave privada + 32 de clave publica
+REFILL_BATCH = 500
+
+# Un lock por archivo: la recarga en segundo plano y la ejecucion no escriben el pool a la vez
+_locks = {}
+_locks_guard = threading.Lock()
+_refills = {}  # Archivo del pool -> hilo de recarga en curso
+
+
+def _lock(path):
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+@contextmanager
+def _locked(path):
+    """Locks the pool file against other threads and other processes (e.g. runs of other tenants sharing it)."""
+    with _lock(path), file_lock(lock_path(path)):
+        yield
+
+
+def make_cipher(key_path):
+    """Returns a Fernet cipher keyed by MIKROGUARD_POOL_KEY, or by the key in `key_path` when it is not set.
+
+    The key file is created on first use, readable only by its owner. Raises
+    ImportError when the cryptography package is not installed.
+    """
+    from cryptography.fernet import Fernet
+
+    key = os.environ.get(KEY_ENV)
+    if not key:
+        if not os.path.exists(key_path):
+            os.makedirs(os.path.dirname(key_path) or ".", exist_ok=True)
+            # Crear el archivo de la clave con permisos solo para el usuario (O_EXCL: otro proceso pudo crearlo)
+            try:
+                fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(Fernet.generate_key())
+        with open(key_path, "rb") as file:
+            key = file.read().strip()
+    return Fernet(key)
+
+
+class KeyPool:
+    """Pre-generated key pairs stored in one file, one fixed-size line per pair. Pairs are taken from the end."""
+
+    def __init__(self, path, encrypt=True):
+        self.path = path
+        self.encrypt = encrypt
+        self._cipher = self._make_cipher() if encrypt else None
+        # Todas las lineas miden lo mismo: el token de Fernet de 64 bytes tiene siempre el mismo largo
+        self.record_size = len(self._encode(bytes(PAIR_SIZE)))
+
+    def _make_cipher(self):
+        try:
+            return make_cipher(self.path + ".key")
+        except ImportError:
+            raise RuntimeError(
+                "El pool de claves cifrado requiere el paquete cryptography (pip install cryptography) "
+                "o key_pool_encrypt = false."
+            ) from None
+
+    def _encode(self, raw):
+        """Returns the line of one raw key pair."""
+        return (self._cipher.encrypt(raw) if self._cipher else base64.b64encode(raw)) + b"\n"
+
+    def _decode(self, line):
+        raw = self._cipher.decrypt(line.rstrip(b"\n")) if self._cipher else base64.b64decode(line)
+        return base64.b64encode(raw[:32]).decode("ascii"), base64.b64encode(raw[32:PAIR_SIZE]).decode("ascii")
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Sin cifrar el pool guarda claves privadas: solo el usuario puede leerlo
+        return os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), "r+b")
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // self.record_size
+        except FileNotFoundError:
+            return 0
+
+    def take(self, n):
+        """Removes up to n key pairs from the end of the pool. Returns them as base64 (private, public) tuples.
+
+        Only the lines taken are read. The file is truncated before the keys
+        are returned, so a key is never handed out twice.
+        """
+        if n <= 0 or not os.path.exists(self.path):
+            return []
+        with _locked(self.path), self._open() as file:
+            # Una linea a medio escribir al final (recarga interrumpida) no cuenta
+            available = os.fstat(file.fileno()).st_size // self.record_size
+            taken = min(n, available)
+            if taken == 0:
+                return []
+            start = (available - taken) * self.record_size
+            file.seek(start)
+            data = file.read(taken * self.record_size)
+            pairs = [self._decode(data[i:i + self.record_size]) for i in range(0, len(data), self.record_size)]
+            file.truncate(start)
+        return pairs
+
+    def add(self, pairs, limit=None):
+        """Appends base64 (private, public) key pairs to the pool. Returns how many were added.
+
+        With `limit`, pairs that would take the pool over that size are dropped;
+        the size is read under the lock, so concurrent refills never overshoot.
+        """
+        if not pairs:
+            return 0
+        with _locked(self.path), self._open() as file:
+            available = os.fstat(file.fileno()).st_size // self.record_size
+            if limit is not None:
+                pairs = pairs[:max(0, limit - available)]
+            # Descartar una linea a medio escribir antes de agregar
+            file.truncate(available * self.record_size)
+            file.seek(available * self.record_size)
+            file.write(b"".join(self._encode(base64.b64decode(private_key) + base64.b64decode(public)) for private_key, public in pairs))
+        return len(pairs)
+
+
+def take_keys(settings, n):
+    """Returns n new key pairs: from the pool when `key_pool` is set, generated for the rest.
+
+    Returns (pairs, how many came from the pool).
+    """
+    path = settings.key_pool
+    pooled = KeyPool(path, settings.key_pool_encrypt).take(n) if path and n > 0 else []
+    generated = get_key_generator(settings.key_backend)(n - len(pooled)) if n > len(pooled) else []
+    return pooled + generated, len(pooled)
+
+
+def refill(settings, workers=None, stop=None):
+    """Tops the pool up to key_pool_size, generating batches in a process pool. Returns the keys added.
+
+    Setting the `stop` event (threading.Event) ends the refill after the batches in flight.
+    """
+    path, size, key_backend = settings.key_pool, settings.key_pool_size, settings.key_backend
+    if not path:
+        return 0
+    pool = KeyPool(path, settings.key_pool_encrypt)
+    # Solo para repartir los lotes: el tope real se aplica bajo el lock en cada add
+    missing = size - len(pool)
+    if missing <= 0:
+        return 0
+    batches = [min(REFILL_BATCH, missing - start) for start in range(0, missing, REFILL_BATCH)]
+    added = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(get_key_generator(key_backend), batch) for batch in batches]
+        for future in futures:
+            if stop is not None and stop.is_set():
+                break
+            pairs = future.result()
+            stored = pool.add(pairs, limit=size)
+            added += stored
+            if stored < len(pairs):
+                break  # Otra recarga (la GUI y el CLI a la vez) ya lleno el pool
+        for pending in futures:
+            pending.cancel()
+    return added
+
+
+def start_refill(settings, stop=None, on_error=None):
+    """Runs refill() in a daemon thread. Returns the thread, or None when the pool is disabled.
+
+    If a refill of the same pool is still running, that thread is returned
+    instead of starting another. An error of the refill is passed to
+    `on_error(exception)` (the GUI shows it); without it, it propagates in the thread.
+    """
+    path = settings.key_pool
+    if path is None:
+        return None
+    with _locks_guard:
+        thread = _refills.get(os.path.abspath(path))
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_refill_reporting, args=(settings, stop, on_error), daemon=True)
+            _refills[os.path.abspath(path)] = thread
+            thread.start()
+    return thread
+
+
+def _refill_reporting(settings, stop, on_error):
+    try:
+        refill(settings, stop=stop)
+    except Exception as e:
+        if on_error is None:
+            raise
+        # En segundo plano un error no debe cerrar la GUI: la ejecucion genera las claves que falten
+        on_error(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fills or inspects the pool of pre-generated WireGuard keys.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    fill = subcommands.add_parser("fill", help="generate keys until the pool has key_pool_size pairs")
+    fill.add_argument("--size", type=int, default=None, help="target size (default: key_pool_size)")
+    fill.add_argument("--workers", type=int, default=None, help="key generation processes (default: CPU count)")
+    subcommands.add_parser("status", help="print how many keys the pool holds")
+    args = parser.parse_args()
+
+    settings = validate(load_config(), check_paths=False)
+    path, size, encrypt = settings.key_pool, settings.key_pool_size, settings.key_pool_encrypt
+    if path is None:
+        parser.error("key_pool no esta configurado en [wireguard]")
+    if args.command == "fill":
+        if args.size is not None:
+            settings = dataclasses.replace(settings, key_pool_size=args.size)
+        added = refill(settings, args.workers)
+        print(f"{added} claves agregadas; el pool tiene {len(KeyPool(path, encrypt))} de {settings.key_pool_size}")
+    else:
+        print(f"{len(KeyPool(path, encrypt))} claves en {path} (objetivo: {size})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+from fsutil import replacing
+from storage import IPV6_COLUMNS
+
+# Columnas que determinan el contenido del .conf y de los scripts de MikroTik de cada peer
+MANIFEST_COLUMNS = ["grupo", "subred", "razon_social", "punto_de_venta", "nombre_vpn", "ip", "clave_publica"]
+
+
+def row_digests(df):
+    """Returns a content hash per row, indexed like the DataFrame."""
+    columns = MANIFEST_COLUMNS + [column for column in IPV6_COLUMNS if column in df]
+    text = df[columns].astype("string").fillna("")
+    joined = text[columns[0]].str.cat([text[column] for column in columns[1:]], sep="\x1f")
+    return joined.map(lambda value: hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest())
+
+
+def row_keys(df, seen=None):
+    """Identifies each peer by its IP. Repeated IPs get their occurrence number so keys stay unique.
+
+    `seen` ({ip: rows so far}) carries the numbering from one batch of rows to the next.
+    """
+    ips = df["ip"].astype(str)
+    occurrence = ips.groupby(ips).cumcount()
+    if seen is not None:
+        occurrence += ips.map(seen).fillna(0).astype(int)
+        for ip, rows in ips.value_counts().items():
+            seen[ip] = seen.get(ip, 0) + rows
+    return ips + "#" + occurrence.astype(str)
+
+
+def load_manifest(manifest_path):
+    """Reads the manifest of the previous run as {row key: digest}. Missing file means empty manifest."""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def manifest_entries(df, digests, keys=None):
+    """Returns {row key: digest} for the rows that have an IP (each peer has a unique one)."""
+    has_ip = df["ip"].notna()
+    return dict(zip((row_keys(df) if keys is None else keys)[has_ip], digests[has_ip]))
+
+
+def save_manifest(manifest_path, df, digests):
+    """Writes the manifest for the rows that have an IP."""
+    write_manifest(manifest_path, manifest_entries(df, digests))
+
+
+def write_manifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    with replacing(manifest_path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=0, sort_keys=True)
+
+
+def changed_rows(df, digests, manifest, keys=None):
+    """Boolean mask of the peers that are new or changed since the manifest was written.
+
+    `keys` are the row keys of `df` when the caller already has them (see row_keys).
+    """
+    previous = (row_keys(df) if keys is None else keys).map(manifest)
+    return df["ip"].notna() & (previous != digests)
@@ -1,9 +1,13 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import configparser
+import multiprocessing
 import os
-import subprocess
+import queue
 import sys
+import threading
+import time
+from settings import PLACEHOLDER_PUBLIC_KEY, ConfigError, validate
 
 # Funcion para obtener la ruta correcta al archivo dentro del ejecutable
 def get_file_path(filename):
@@ -27,26 +31,56 @@ def load_config():
     if not os.path.exists(config_path):
         # Crear valores predeterminados si no existe
         config["metadata"] = {
-            "project_name = MikroGuard",
-            "version = 1.0.0",
-            "author = S0L15",
-            "email = d3v.s0l15@gmail.com",
-            "icon_path = icon\MikroGuard_logo_1.png"
+            "project_name": "MikroGuard",
+            "version": "1.0.0",
+            "author": "S0L15",
+            "contact_email": "d3v.s0l15@gmail.com",
+            "icon_path": "icon\\MikroGuard_logo_1.png",
         }
         config["netconfig"] = {
-            "base_network": "192.168.1.0",
+            "base_network": "192.168.0.0/16",
             "subnet_prefix": "24",
             "database_path": "db/default.xlsx",
             "default_group_size": "4",
-            "interface": "WG"
+            "interface": "WG",
+            "allocation_db": "",
+            "base_network6": "",
+            "subnet_prefix6": "64",
+            "batch_rows": "0",
         }
         config["wireguard"] = {
-            "public_key_custom_text": "default_public_key",
-            "endpoint_custom_text": "127.0.0.1:51820",
+            "public_key_custom_text": PLACEHOLDER_PUBLIC_KEY,
+            "endpoint_custom_text": "127.0.0.1",
             "port_custom_text": "51820",
+            "key_backend": "native",
+            "io_workers": "8",
+            "atomic_writes": "true",
+            "key_pool": "",
+            "key_pool_size": "5000",
+            "key_pool_encrypt": "true",
         }
         config["output"] = {
             "output_path": "src/output/",
+            "incremental": "false",
+            "export_xlsx": "false",
+            "run_report": "true",
+            "lock_timeout": "300",
+            "tunnels_format": "files",
+            "bundle_groups": "none",
+            "qr_codes": "none",
+        }
+        config["mikrotik"] = {
+            "lookup": "indexed",
+            "chunk_size": "0",
+        }
+        config["routeros"] = {
+            "routers": "",
+            "username": "admin",
+            "password": "",
+            "tls": "false",
+            "timeout": "10",
+            "pool_size": "4",
+            "batch_size": "200",
         }
         save_config(config)  # Guardar valores predeterminados
     else:
@@ -55,15 +89,44 @@ def load_config():
         config.setdefault("netconfig", {})
         config.setdefault("wireguard", {})
         config.setdefault("output", {})
-        config["netconfig"].setdefault("base_network", "192.168.1.0")
+        config.setdefault("mikrotik", {})
+        config.setdefault("routeros", {})
+        config.setdefault("metadata", {})
+        config["netconfig"].setdefault("base_network", "192.168.0.0/16")
         config["netconfig"].setdefault("subnet_prefix", "24")
         config["netconfig"].setdefault("database_path", "db/default.xlsx")
         config["netconfig"].setdefault("default_group_size", "4")
         config["netconfig"].setdefault("interface", "WG")
-        config["wireguard"].setdefault("public_key_custom_text", "default_public_key")
-        config["wireguard"].setdefault("endpoint_custom_text", "127.0.0.1:51820")
+        config["netconfig"].setdefault("allocation_db", "")
+        config["netconfig"].setdefault("base_network6", "")
+        config["netconfig"].setdefault("subnet_prefix6", "64")
+        config["netconfig"].setdefault("batch_rows", "0")
+        config["wireguard"].setdefault("public_key_custom_text", PLACEHOLDER_PUBLIC_KEY)
+        config["wireguard"].setdefault("endpoint_custom_text", "127.0.0.1")
         config["wireguard"].setdefault("port_custom_text", "51820")
+        config["wireguard"].setdefault("key_backend", "native")
+        config["wireguard"].setdefault("io_workers", "8")
+        config["wireguard"].setdefault("atomic_writes", "true")
+        config["wireguard"].setdefault("key_pool", "")
+        config["wireguard"].setdefault("key_pool_size", "5000")
+        config["wireguard"].setdefault("key_pool_encrypt", "true")
         config["output"].setdefault("output_path", "output/")
+        config["output"].setdefault("incremental", "false")
+        config["output"].setdefault("export_xlsx", "false")
+        config["output"].setdefault("run_report", "true")
+        config["output"].setdefault("lock_timeout", "300")
+        config["output"].setdefault("tunnels_format", "files")
+        config["output"].setdefault("bundle_groups", "none")
+        config["output"].setdefault("qr_codes", "none")
+        config["mikrotik"].setdefault("lookup", "indexed")
+        config["mikrotik"].setdefault("chunk_size", "0")
+        config["routeros"].setdefault("routers", "")
+        config["routeros"].setdefault("username", "admin")
+        config["routeros"].setdefault("password", "")
+        config["routeros"].setdefault("tls", "false")
+        config["routeros"].setdefault("timeout", "10")
+        config["routeros"].setdefault("pool_size", "4")
+        config["routeros"].setdefault("batch_size", "200")
         config["metadata"].setdefault("project_name", "MikroGuard")
         config["metadata"].setdefault("version", "1.0.0")
         config["metadata"].setdefault("author", "S0L15")
@@ -79,22 +142,68 @@ def save_config(config):
         config.write(configfile)
 
 
-def run_scripts_in_order(scripts):
-    """Runs a list of scripts. If one fails it stops"""
-    for script in scripts:
+def run_pipeline(config, events, cancel):
+    """Runs the netconfig, WireGuard and MikroTik stages in-process. If one fails it stops.
+
+    Meant to run in a worker thread: it never touches Tk. Progress events from
+    the pipeline and a final {"event": "finished"|"cancelled"|"error"} event
+    are put on the `events` queue.
+    """
+    # Importar aqui: pandas y openpyxl se cargan al ejecutar (o en prewarm), no al abrir la ventana
+    try:
+        from pipeline import Pipeline, PipelineCancelled
+    except ImportError as e:
+        events.put({"event": "error", "message": f"A required module could not be loaded.\n{e}"})
+        return
+    try:
+        Pipeline(config).run(on_event=events.put, cancel=cancel)
+    except PipelineCancelled:
+        events.put({"event": "cancelled"})
+    except FileNotFoundError as e:
+        events.put({"event": "error", "message": f"File could not be found.\n{e}"})
+    except Exception as e:
+        events.put({"event": "error", "message": f"Unexpected error running the scripts.\n{e}"})
+    else:
+        events.put({"event": "finished"})
+
+
+def prewarm(config=None, stop=None, events=None):
+    """Imports the pipeline modules (pandas, openpyxl) in the background so the first run starts at once.
+
+    With `config`, the key pool (key_pool in [wireguard]) is then refilled
+    until `stop` is set. A refill error is put on `events` as a
+    {"event": "warning", "message"} event.
+    """
+    try:
+        import pipeline  # noqa: F401
+        import openpyxl  # noqa: F401
+        import keypool
+    except ImportError:
+        return  # El error se informa al ejecutar
+    if config is not None:
         try:
-            subprocess.run(["python", script], check=True)
-            messagebox.showinfo("Success", f"{script} executed successfully.")
-        except FileNotFoundError:
-            messagebox.showerror("Error", f"File {script} could not be found.")
-            return False
-        except subprocess.CalledProcessError as e:
-            messagebox.showerror("Error", f"There was an error running {script}.\n{e}")
-            return False
-        except Exception as e:
-            messagebox.showerror("Error", f"Unexpected error runnning {script}.\n{e}")
-            return False
-    return True
+            settings = validate(config, check_paths=False)
+        except ConfigError:
+            return  # Configuracion a medio editar: se informa al ejecutar
+
+        def on_error(e):
+            if events is not None:
+                events.put({"event": "warning", "message": f"The key pool could not be refilled: {e}"})
+
+        keypool.start_refill(settings, stop, on_error)
+
+
+def describe_event(event):
+    """Returns the progress line shown in the GUI for a finished stage."""
+    elapsed = event["elapsed"]
+    parts = [f"{event['rows']} rows"]
+    if "keys" in event:
+        parts.append(f"{event['keys']} new keys")
+    if "files" in event:
+        parts.append(f"{event['files']} files written")
+    throughput = f", {event['rows'] / elapsed:,.0f} rows/s" if elapsed > 0 else ""
+    return f"{event['stage']}: " + ", ".join(parts) + f" in {elapsed:.2f} s{throughput}"
+
 
 # GUI principal
 def main():
@@ -105,7 +214,7 @@ def main():
     icon = tk.PhotoImage(file=icon_path)
     root.iconphoto(False, icon)
     root.title(config["metadata"]["project_name"] + " version: " + config["metadata"]["version"])
-    root.geometry("550x650")
+    root.geometry("550x800")
 
     # Seccion de NetConfig
     tk.Label(root, text="NetConfig", font=("Arial", 12, "bold")).grid(
@@ -115,7 +224,7 @@ def main():
     tk.Label(root, text="Base Network:").grid(row=1, column=0, sticky="e", padx=10)
     base_network = tk.Entry(root, width=40)
     base_network.grid(row=1, column=1, pady=5)
-    base_network.insert(0, config["netconfig"].get("base_network", "192.168.1.0"))
+    base_network.insert(0, config["netconfig"].get("base_network", "192.168.0.0/16"))
     # Subnet Prefix
     tk.Label(root, text="Subnet Prefix:").grid(row=2, column=0, sticky="e", padx=10)
     subnet_prefix = tk.Entry(root, width=40)
@@ -155,7 +264,7 @@ def main():
     public_key = tk.Entry(root, width=40)
     public_key.grid(row=7, column=1, pady=5)
     public_key.insert(
-        0, config["wireguard"].get("public_key_custom_text", "default_public_key")
+        0, config["wireguard"].get("public_key_custom_text", PLACEHOLDER_PUBLIC_KEY)
     )
     tk.Label(root, text="Endpoint:").grid(row=8, column=0, sticky="e", padx=10)
     endpoint = tk.Entry(root, width=40)
@@ -184,6 +293,12 @@ def main():
         root, text="Explore", command=select_output_path, width=10
     ).grid(row=11, column=2, padx=5, pady=5)
 
+    # Modo incremental: solo procesa filas nuevas o modificadas desde la ultima ejecucion
+    incremental = tk.BooleanVar(value=config["output"].getboolean("incremental", fallback=False))
+    tk.Checkbutton(
+        root, text="Incremental run (only new or changed rows)", variable=incremental
+    ).grid(row=12, column=1, sticky="w", pady=5)
+
     def save_config_from_entries():
         """Saves config set by user on config.ini"""
         try:
@@ -194,6 +309,7 @@ def main():
             config["wireguard"]["endpoint_custom_text"] = endpoint.get()
             config["wireguard"]["port_custom_text"] = port.get()
             config["output"]["output_path"] = output_path_entry.get()
+            config["output"]["incremental"] = str(incremental.get()).lower()
             save_config(config)
             messagebox.showinfo("Configuracion", "Config saved successfully")
         except Exception as e:
@@ -203,26 +319,107 @@ def main():
     save_button = tk.Button(
         root, text="Save Config", command=save_config_from_entries, width=20
     )
-    save_button.grid(row=12, column=0, columnspan=3, pady=(20, 10))
+    save_button.grid(row=13, column=0, columnspan=3, pady=(20, 10))
 
-    # Boton para ejecutar scripts
-    def run_scripts():
-        scripts = [
-            get_file_path("netconfig.py"),
-            get_file_path("wireguardconfig.py"),
-            get_file_path("mikrotikconfig.py")
-        ]
-        if run_scripts_in_order(scripts):
+    # Ejecucion en segundo plano: el hilo de trabajo envia eventos por una cola que la GUI revisa con after()
+    events = queue.Queue()
+    cancel = threading.Event()
+    state = {"worker": None, "stage": None, "stage_start": 0.0}
+    status = tk.StringVar(value="Ready")
+    tk.Label(root, textvariable=status, anchor="w").grid(row=15, column=0, columnspan=3, sticky="we", padx=10)
+    progress_log = tk.Listbox(root, height=5, width=70)
+    progress_log.grid(row=16, column=0, columnspan=3, padx=10, pady=(5, 10))
+
+    def poll_events():
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+            if event["event"] == "start":
+                state["stage"], state["stage_start"] = event["stage"], time.perf_counter()
+            elif event["event"] == "done":
+                state["stage"] = None
+                progress_log.insert(tk.END, describe_event(event))
+            elif event["event"] == "warning":
+                progress_log.insert(tk.END, event["message"])
+            else:
+                finish_run(event)
+        if state["stage"] is not None:
+            status.set(f"Running {state['stage']}... {time.perf_counter() - state['stage_start']:.0f} s")
+        root.after(100, poll_events)
+
+    def finish_run(event):
+        state["worker"], state["stage"] = None, None
+        run_button.config(state=tk.NORMAL)
+        cancel_button.config(state=tk.DISABLED)
+        if event["event"] == "finished":
+            start_prewarm()  # Reponer las claves que uso la ejecucion
+            status.set("Finished")
             messagebox.showinfo("Success", "Scripts executed successfully.")
+        elif event["event"] == "cancelled":
+            status.set("Cancelled")
+            messagebox.showwarning("Cancelled", "The run was cancelled. The manifest was not updated.")
         else:
-            messagebox.showerror("Error", "There was an error while running the scripts")
+            status.set("Error")
+            messagebox.showerror("Error", event["message"])
+
+    # Boton para ejecutar scripts
+    def run_scripts():
+        if state["worker"] is not None:
+            return
+        # Copia de la configuracion: guardar cambios durante la ejecucion no afecta a la corrida en curso
+        run_config = configparser.ConfigParser()
+        run_config.read_dict(config)
+        try:
+            validate(run_config)
+        except ConfigError as e:
+            messagebox.showerror("Invalid configuration", str(e))
+            return
+        cancel.clear()
+        progress_log.delete(0, tk.END)
+        status.set("Starting...")
+        run_button.config(state=tk.DISABLED)
+        cancel_button.config(state=tk.NORMAL)
+        state["worker"] = threading.Thread(target=run_pipeline, args=(run_config, events, cancel), daemon=True)
+        state["worker"].start()
+
+    def cancel_run():
+        cancel.set()
+        status.set("Cancelling after the current step...")
+
+    def start_prewarm():
+        # Copia de la configuracion: la recarga del pool no lee valores a medio editar
+        prewarm_config = configparser.ConfigParser()
+        prewarm_config.read_dict(config)
+        threading.Thread(target=prewarm, args=(prewarm_config, stop_refill, events), daemon=True).start()
+
+    def on_close():
+        cancel.set()
+        stop_refill.set()
+        root.destroy()
 
     run_button = tk.Button(
         root, text="Run Scripts", command=run_scripts, width=20
     )
-    run_button.grid(row=13, column=0, columnspan=3, pady=(10, 20))
+    run_button.grid(row=14, column=0, columnspan=3, pady=(10, 5), padx=(0, 180))
+    cancel_button = tk.Button(
+        root, text="Cancel", command=cancel_run, width=20, state=tk.DISABLED
+    )
+    cancel_button.grid(row=14, column=0, columnspan=3, pady=(10, 5), padx=(180, 0))
+    root.protocol("WM_DELETE_WINDOW", on_close)
 
+    # Con la ventana ya visible, cargar los modulos pesados y recargar el pool de claves en segundo plano
+    stop_refill = threading.Event()
+    root.after(200, start_prewarm)
+    # La cola se revisa siempre: tambien trae los avisos de la recarga del pool fuera de una ejecucion
+    root.after(100, poll_events)
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Necesario para el pool de procesos del CLI en el ejecutable
+    if len(sys.argv) > 1:
+        # Con argumentos se ejecuta sin interfaz grafica (ver cli.py)
+        import cli
+        sys.exit(cli.main())
     main()
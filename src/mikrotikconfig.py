@@ -1,81 +1,21 @@
+import argparse
 import csv
-import configparser
-from wireguardconfig import output_csv
-from os import makedirs
-
-# Cargar el archivo de configuracion
-config = configparser.ConfigParser()
-config.read("src/config.ini")
-
-# Leer valores del archivo de configuracion
-input_csv = output_csv
-output_path = config["output"].get("output_path") + "/mikrotik/"
-endpoint = config["wireguard"].get("endpoint_custom_text")
-port = config["wireguard"].get("port_custom_text")
-interface = config["netconfig"].get("interface")
-
-# Crear los directorios de salida si no existen
-makedirs(output_path, exist_ok=True)
-
-# Leer las subredes desde el archivo CSV
-subredes = []
-razones_sociales = []
-nombresVpn = []
-ips = []
-clavesPublica = []
-
-# Conjunto para verificar duplicados
-subredes_set = set()
-razones_sociales_set = set()
-nombresVpn_set = set()
-ips_set = set()
-clavesPublica_set = set()
-
-with open(input_csv, "r") as infile:
-    reader = csv.DictReader(infile)
-    for row in reader:
-        subred = row.get("subred")
-        razon_social = row.get("razon_social")
-        nombreVpn = row.get("nombre_vpn")
-        ip = row.get("ip")
-        clavePublica = row.get("clave_publica")
-
-        if subred and subred not in subredes_set:  # Verifica si la subred ya fue agregada
-            subredes.append(subred)
-            subredes_set.add(subred)
-        if razon_social and razon_social not in razones_sociales_set:  # Verifica si el razon_social ya fue agregado
-            razones_sociales.append(razon_social)
-            razones_sociales_set.add(razon_social)
-        if nombreVpn and nombreVpn not in nombresVpn_set:  # Verifica si el nombreVpn ya fue agregado
-            nombresVpn.append(nombreVpn)
-            nombresVpn_set.add(nombreVpn)
-        if ip and ip not in ips_set:  # Verifica si la ip ya fue agregada
-            ips.append(ip)
-            ips_set.add(ip)
-        if clavePublica and clavePublica not in clavesPublica_set:  # Verifica si la clave publica ya fue agregada
-            clavesPublica.append(clavePublica)
-            clavesPublica_set.add(clavePublica)
-
-# Convertir las listas a cadenas separadas por espacios, con comillas y punto y coma al final de cada elemento
-subredes_str = "".join([f'"{subred}";\n' for subred in subredes])
-razones_sociales_str = "".join([f'"{razon_social}";\n' for razon_social in razones_sociales])
-nombresVpn_str = "".join([f'"{nombreVpn}";\n' for nombreVpn in nombresVpn])
-ips_str = "".join([f'"{ip}";\n' for ip in ips])
-clavesPublica_str = "".join([f'"{clavePublica}";\n' for clavePublica in clavesPublica])
-
-# Generar el script para MikroTik - Subredes
-script_lines_address = [
-    "# Script generado para agregar subredes a MikroTik",
-    ":local subredes {\n" + subredes_str[:-2] + "\n}\n",  # Lista de subredes con elementos separados por espacios y punto y coma
-    ":local clientes {\n" + razones_sociales_str[:-2] + "\n}"   # Lista de razones_sociales con elementos separados por espacios y punto y coma
-]
-
-script_lines_address.append(""" 
-# Verificar si cada subred ya esta configurada y agregarla si es necesario
-:for i from=0 to=([ :len $subredes ] - 1) do={
-    :local subred [:pick $subredes $i]
-    :local cliente [:pick $clientes $i]
+import glob
+import io
+from os import makedirs, remove
+from fsutil import replacing
+from instrumentation import count, timer
+from settings import load_config, mikrotik_output_path, run_lock, validate, wireguard_output_paths
+from typing import NamedTuple
 
+# Verificacion de existencia en el router para cada modo de busqueda.
+# "indexed" filtra con find (una sola orden por elemento); "scan" recorre todos los elementos con get.
+ADDRESS_CHECKS = {
+    "indexed": """
+    # Verificar si la subred ya esta en la lista de direcciones
+    :local encontrado ([:len [/ip address find address=$subred]] > 0)
+""",
+    "scan": """
     # Verificar si la subred ya esta en la lista de direcciones
     :local encontrado false
     :foreach direccion in=[/ip address find] do={
@@ -83,7 +23,169 @@ script_lines_address.append("""
             :set encontrado true
         }
     }
+""",
+}
+
+ADDRESS6_CHECKS = {
+    "indexed": """
+    # Verificar si la subred IPv6 ya esta en la lista de direcciones
+    :local encontrado ([:len [/ipv6 address find address=$subred6]] > 0)
+""",
+    "scan": """
+    # Verificar si la subred IPv6 ya esta en la lista de direcciones
+    :local encontrado false
+    :foreach direccion in=[/ipv6 address find] do={
+        :if ( [/ipv6 address get $direccion address] = $subred6 ) do={
+            :set encontrado true
+        }
+    }
+""",
+}
+
+PEER_CHECKS = {
+    "indexed": """
+    # Verificar si el peer ya esta configurado (por clave publica o por ip)
+    :local encontrado (([:len [/interface wireguard peers find public-key=$clavePublica]] > 0) or ([:len [/interface wireguard peers find allowed-address=$ipList]] > 0))
+""",
+    "scan": """
+    # Verificar si el peer ya esta en la lista de direcciones
+    :local encontrado false
+    :foreach direccion in=[/interface wireguard peers find] do={  # Verificacion de peers de WireGuard
+        :if ( [/interface wireguard peers get $direccion allowed-address] = $ipList ) do={
+            :set encontrado true
+        }
+    }
+""",
+}
+
+
+class Peer(NamedTuple):
+    """One row of the WireGuard CSV, with only the columns the MikroTik scripts use ("" when empty)."""
+    subred: str
+    razon_social: str
+    nombre_vpn: str
+    ip: str
+    clave_publica: str
+    subred6: str = ""
+    ip6: str = ""
+
+
+def read_rows(input_csv):
+    """Streams the peer rows of the CSV written by the WireGuard stage, one Peer at a time."""
+    with open(input_csv, "r", newline="", encoding="utf-8") as infile:
+        reader = csv.reader(infile)
+        header = next(reader, [])
+        # Columnas que faltan en el CSV se leen como vacias
+        columns = [header.index(field) if field in header else None for field in Peer._fields]
+        for row in reader:
+            yield Peer(*("" if column is None or column >= len(row) else row[column] for column in columns))
+
+
+def dataframe_rows(df):
+    """Converts a DataFrame into Peer rows, with empty cells as ""."""
+    values = [
+        ["" if value is None or value != value else str(value) for value in df[field]] if field in df else [""] * len(df)
+        for field in Peer._fields
+    ]
+    return [Peer(*row) for row in zip(*values)]
+
+
+def collect(rows):
+    """Deduplicates the rows in one pass. Returns (addresses, peers).
+
+    `addresses` holds one Peer per subnet (its client is the razon_social of
+    the first row with that subnet): the IPv4 subnets first, with subred6
+    cleared, then the IPv6 ones, with subred cleared. `peers` holds one Peer
+    per public key, so the name, IPs and key of each peer always come from
+    the same row.
+    """
+    addresses = {}
+    addresses6 = {}
+    peers = {}
+    for row in rows:
+        if row.subred and row.subred not in addresses:
+            addresses[row.subred] = row._replace(subred6="")
+        if row.subred6 and row.subred6 not in addresses6:
+            addresses6[row.subred6] = row._replace(subred="")
+        # Un peer necesita IP y clave publica para el router; se identifica por su clave
+        if (row.ip or row.ip6) and row.clave_publica and row.clave_publica not in peers:
+            peers[row.clave_publica] = row
+    return list(addresses.values()) + list(addresses6.values()), list(peers.values())
+
+
+def generate_scripts(rows, settings, suffix="", chunk_size=None):
+    """Writes the MikroTik scripts for the subnets and the peers in `rows` (Peer records).
+
+    `suffix` is appended to the file names (e.g. "_delta" for incremental runs).
+    `chunk_size` overrides the chunk_size option of the [mikrotik] section.
+    """
+    # Leer valores de la configuracion validada
+    output_path = mikrotik_output_path(settings)
+    interface = settings.interface
+    lookup = settings.lookup  # "indexed" (find filtrado) o "scan"
+    if chunk_size is None:
+        chunk_size = settings.chunk_size  # 0: un solo script
+
+    # Crear los directorios de salida si no existen
+    makedirs(output_path, exist_ok=True)
+
+    # Una sola pasada sobre las filas: subredes unicas y peers unicos, alineados por fila
+    with timer("mikrotik.collect"):
+        addresses, peers = collect(rows)
+
+    chunks_address = write_scripts(
+        output_path, f"mikrotik_address{suffix}", addresses,
+        lambda addresses, footer: render_address_script(addresses, interface, lookup, footer),
+        chunk_size,
+    )
+    chunks_peers = write_scripts(
+        output_path, f"mikrotik_peers{suffix}", peers,
+        lambda peers, footer: render_peers_script(peers, interface, lookup, footer),
+        chunk_size,
+    )
+
+    print(f"Script de MikroTik generado: {output_path}mikrotik_address{suffix}.rsc" + (f" ({chunks_address} bloques)" if chunks_address else ""))
+    print(f"Script de MikroTik generado: {output_path}mikrotik_peers{suffix}.rsc" + (f" ({chunks_peers} bloques)" if chunks_peers else ""))
+
+
+def write_rsc_list(out, name, values):
+    """Writes a RouterOS array (`:local name {...}`), one quoted element per line."""
+    out.write(f":local {name} {{\n")
+    separator = ""
+    for value in values:
+        out.write(f'{separator}"{value}"')
+        separator = ";\n"
+    out.write("\n}")
+
+
+def render_address_script(addresses, interface, lookup, footer=""):
+    """Returns the script that adds the subnets of `addresses` to MikroTik."""
+    out = io.StringIO()
+    out.write("# Script generado para agregar subredes a MikroTik\n")
+    addresses4 = [address for address in addresses if address.subred]
+    addresses6 = [address for address in addresses if address.subred6]
+    if addresses4:
+        render_address4_loop(out, addresses4, interface, lookup)
+    if addresses6:
+        render_address6_loop(out, addresses6, interface, lookup)
+    out.write(footer)
+    return out.getvalue()
 
+
+def render_address4_loop(out, addresses, interface, lookup):
+    """Writes the IPv4 subnet and client arrays and the loop that adds the subnets."""
+    write_rsc_list(out, "subredes", (address.subred for address in addresses))
+    out.write("\n\n")
+    write_rsc_list(out, "clientes", (address.razon_social for address in addresses))
+    out.write("""
+ 
+# Verificar si cada subred ya esta configurada y agregarla si es necesario
+:for i from=0 to=([ :len $subredes ] - 1) do={
+    :local subred [:pick $subredes $i]
+    :local cliente [:pick $clientes $i]
+""")
+    out.write(ADDRESS_CHECKS[lookup])
+    out.write("""
     # Si la subred no esta en la lista, agregarla
     :if ($encontrado = false) do={
         /ip address add address=$subred interface=""" + interface + """ comment="WG $cliente"
@@ -94,46 +196,162 @@ script_lines_address.append("""
 }
 """)
 
-# Generar el script para MikroTik - Peers
-script_lines_peers = [
-    "# Script generado para agregar peers a MikroTik",
-    ":local nombresVpn {\n" + nombresVpn_str[:-2] + "\n}\n",  # Lista de nombres vpn con elementos separados por espacios y punto y coma
-    ":local ips {\n" + ips_str[:-2] + "\n}\n",   # Lista de ips con elementos separados por espacios y punto y coma
-    ":local clavesPublica {\n" + clavesPublica_str[:-2] + "\n}"  # Lista de claves publicas con elementos separados por espacios y punto y coma
-]
 
-script_lines_peers.append(""" 
+def render_address6_loop(out, addresses, interface, lookup):
+    """Writes the IPv6 subnet and client arrays and the loop that adds the subnets (dual stack)."""
+    out.write("\n")
+    write_rsc_list(out, "subredes6", (address.subred6 for address in addresses))
+    out.write("\n\n")
+    write_rsc_list(out, "clientes6", (address.razon_social for address in addresses))
+    out.write("""
+
+# Verificar si cada subred IPv6 ya esta configurada y agregarla si es necesario
+:for i from=0 to=([ :len $subredes6 ] - 1) do={
+    :local subred6 [:pick $subredes6 $i]
+    :local cliente [:pick $clientes6 $i]
+""")
+    out.write(ADDRESS6_CHECKS[lookup])
+    out.write("""
+    # Si la subred no esta en la lista, agregarla
+    :if ($encontrado = false) do={
+        /ipv6 address add address=$subred6 interface=""" + interface + """ advertise=no comment="WG $cliente"
+        :log info ("Subred IPv6 agregada: " . $subred6 . " con comentario: " . $cliente)
+    } else={
+        :log info ("La subred IPv6 ya existe: " . $subred6)
+    }
+}
+""")
+
+
+def render_peers_script(peers, interface, lookup, footer=""):
+    """Returns the script that adds the WireGuard peers of `peers` to MikroTik."""
+    out = io.StringIO()
+    out.write("# Script generado para agregar peers a MikroTik\n")
+    write_rsc_list(out, "nombresVpn", (peer.nombre_vpn for peer in peers))
+    out.write("\n\n")
+    # Con doble pila allowed-address lleva las dos direcciones separadas por coma
+    write_rsc_list(out, "ips", (",".join(filter(None, [peer.ip, peer.ip6])) for peer in peers))
+    out.write("\n\n")
+    write_rsc_list(out, "clavesPublica", (peer.clave_publica for peer in peers))
+    out.write("""
+ 
 # Verificar si cada peer ya esta configurado y agregarlo si es necesario
 :for i from=0 to=([ :len $nombresVpn ] - 1) do={
     :local nombreVpn [:pick $nombresVpn $i]
     :local ipList [:pick $ips $i]
     :local clavePublica [:pick $clavesPublica $i]
-
-    # Verificar si el peer ya esta en la lista de direcciones
-    :local encontrado false
-    :foreach direccion in=[/interface wireguard peers find] do={  # Verificacion de peers de WireGuard
-        :if ( [/interface wireguard peers get $direccion allowed-address] = $ipList ) do={
-            :set encontrado true
-        }
-    }
-
+""")
+    out.write(PEER_CHECKS[lookup])
+    out.write("""
     # Si el peer no esta en la lista, agregarlo
     :if ($encontrado = false) do={
-        /interface wireguard peers add name=$nombreVpn public-key=$clavePublica allowed-address=$ipList interface=""" + interface +""" persistent-keepalive=30
+        /interface wireguard peers add name=$nombreVpn public-key=$clavePublica allowed-address=$ipList interface=""" + interface + """ persistent-keepalive=30
         :log info ("Peer agregado: " . $nombreVpn . " con ip: " . $ipList)
     } else={
         :log info ("El peer ya existe: " . $nombreVpn)
     }
 }
 """)
+    out.write(footer)
+    return out.getvalue()
+
+
+def progress_variable(stem):
+    """Name of the RouterOS global that stores the last imported chunk (e.g. mgMikrotikPeers)."""
+    return "mg" + "".join(part.capitalize() for part in stem.split("_"))
+
+
+def write_scripts(output_path, stem, items, render, chunk_size=0):
+    """Writes `stem`.rsc. Returns the number of chunks written (0 when a single script is enough).
+
+    `render(items, footer)` returns the text of a script. With chunk_size > 0
+    and more items than that, the items are split into numbered scripts
+    (`stem`_001.rsc, ...) of at most chunk_size items, and `stem`.rsc
+    becomes an index that imports them in order. Each chunk records
+    its number in a global variable once it finishes, so running the index
+    again after a failure resumes from the first chunk not yet completed.
+    """
+    # Borrar bloques de una ejecucion anterior para no mezclarlos con los nuevos
+    for old_chunk in glob.glob(glob.escape(output_path + stem) + "_[0-9][0-9][0-9].rsc"):
+        remove(old_chunk)
+
+    total = len(items)
+    if chunk_size <= 0 or total <= chunk_size:
+        # Guardar el script generado en un archivo .rsc
+        with timer("mikrotik.render"):
+            script = render(items, "")
+        write_rsc(output_path + f"{stem}.rsc", script)
+        return 0
+
+    variable = progress_variable(stem)
+    chunks = (total + chunk_size - 1) // chunk_size
+    for number in range(1, chunks + 1):
+        start = (number - 1) * chunk_size
+        footer = f"""
+# Marcar el bloque como completado para poder reanudar la importacion
+:global {variable}
+:set {variable} {number}
+:log info ("MikroGuard: bloque {number} de {chunks} de {stem} completado")
+"""
+        with timer("mikrotik.render"):
+            script = render(items[start:start + chunk_size], footer)
+        write_rsc(output_path + f"{stem}_{number:03d}.rsc", script)
+
+    index_lines = [
+        f"# Script generado para importar {stem} por bloques en MikroTik",
+        "# Si la importacion falla, volver a ejecutar este script: continua desde el ultimo bloque completado.",
+        f'# Para empezar desde el primer bloque: /system script environment remove [find name="{variable}"]',
+        f":global {variable}",
+        f':if ([:typeof ${variable}] != "num") do={{ :set {variable} 0 }}',
+    ]
+    for number in range(1, chunks + 1):
+        index_lines.append(f"""
+:if (${variable} < {number}) do={{
+    :log info ("MikroGuard: importando bloque {number} de {chunks} de {stem}")
+    /import file-name={stem}_{number:03d}.rsc
+}}""")
+    index_lines.append(f"""
+# Todos los bloques completados: reiniciar el progreso para la proxima importacion
+:set {variable} 0
+:log info ("MikroGuard: importacion de {stem} completada")
+""")
+    write_rsc(output_path + f"{stem}.rsc", "\n".join(index_lines))
+    return chunks
+
+
+def write_rsc(path, script):
+    """Writes one .rsc file (through a temporary file, see fsutil.replacing) and records it in the run counters."""
+    with timer("mikrotik.write"):
+        with replacing(path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as outfile:
+            outfile.write(script)
+    count("files.rsc")
+    count("bytes.rsc", len(script))
+
+
+def run(settings, df=None, chunk_size=None):
+    """Runs the MikroTik stage. Reads the WireGuard CSV unless a DataFrame is given."""
+    if df is None:
+        # El CSV se lee en streaming mientras generate_scripts deduplica las filas
+        _, input_csv, _ = wireguard_output_paths(settings)
+        rows = read_rows(input_csv)
+    else:
+        with timer("mikrotik.read"):
+            rows = dataframe_rows(df)
+    generate_scripts(rows, settings, chunk_size=chunk_size)
+    return df
+
 
-# Guardar el script generado en un archivo .rsc
-with open(output_path + "mikrotik_address.rsc", "w") as outfile:
-    outfile.write("\n".join(script_lines_address))
+def main():
+    parser = argparse.ArgumentParser(description="Generates the MikroTik scripts from the WireGuard CSV.")
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="Split the scripts into numbered files of at most this many entries (0: a single script)",
+    )
+    args = parser.parse_args()
+    settings = validate(load_config(), check_paths=False)
+    with run_lock(settings):
+        run(settings, chunk_size=args.chunk_size)
 
-# Guardar el script generado en un archivo .rsc
-with open(output_path + "mikrotik_peers.rsc", "w") as outfile:
-    outfile.write("\n".join(script_lines_peers))
 
-print(f"Script de MikroTik generado: {output_path + "mikrotik_address.rsc"}")
-print(f"Script de MikroTik generado: {output_path + "mikrotik_peers.rsc"}")
+if __name__ == "__main__":
+    main()
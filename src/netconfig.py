@@ -1,129 +1,185 @@
-import pandas as pd
-import ipaddress
-from openpyxl import load_workbook
-import configparser
 import os
+import storage
+from allocdb import AllocationStore
+from fsutil import replacing
+from instrumentation import timer
+from ipallocator import IPAllocator
+from settings import load_config, netconfig_output_paths, run_lock, validate
 
-# Cargar el archivo de configuracion
-config = configparser.ConfigParser()
-config.read("src/config.ini")
-
-# Leer valores del archivo de configuracion
-base_network = ipaddress.IPv4Network(config["netconfig"].get("base_network"))  # Rango base
-subnet_prefix = config["netconfig"].getint("subnet_prefix")  # Tamaño de las subredes
-database_path = config["netconfig"].get("database_path")
-group_size = config["netconfig"].getint("default_group_size")  # Asegurarse que sea un entero
-output_path = config["output"].get("output_path") + "/db/"
-
-# Asegurarse de que la carpeta de salida exista
-os.makedirs(output_path, exist_ok=True)
-
-output_excel = os.path.join(output_path, os.path.basename(database_path))
-output_csv = os.path.join(output_path, os.path.basename(database_path).replace(".xlsx", ".csv"))
 
 # Funcion para generar nombres de VPN unicos en mayusculas, reemplazando espacios por barra baja (_)
-def generate_vpn_name(punto_de_venta):
-    if pd.isna(punto_de_venta) or not punto_de_venta.strip():  # Verificar si el nombre esta vacio o es nulo
-        return "VPN_DEFAULT"  # Nombre predeterminado si no hay punto_de_venta
-    
+def generate_vpn_names(puntos_de_venta):
+    texto = puntos_de_venta.astype("string").str.strip()  # Eliminar espacios al inicio y al final
+
     # Reemplazar espacios por barra baja (_) y mantener solo letras, numeros y guiones bajos
-    vpn_name = punto_de_venta.strip()  # Eliminar espacios al inicio y al final
-    vpn_name = vpn_name.replace(" ", "_")  # Reemplazar espacios por barra baja
+    # (en Python \w equivale a isalnum() o "_")
+    nombres = texto.str.replace(" ", "_", regex=False).str.replace(r"[^\w]", "", regex=True)
 
-    # Mantener solo caracteres alfanumericos y guiones bajos, eliminando otros caracteres no validos
-    vpn_name = ''.join(e for e in vpn_name if e.isalnum() or e == '_')
-    
     # Convertir todo a mayusculas para estandarizar
-    vpn_name = vpn_name.upper()
-    
-    return vpn_name
-
-# Leer datos del archivo Excel existente
-try:
-    df = pd.read_excel(database_path)
-except FileNotFoundError:
-    raise FileNotFoundError(f"No se encontro el archivo {database_path}. Asegurate de crearlo primero.")
-
-# Asignar grupos predeterminados si no estan definidos
-group_counter = 1  # Contador para los grupos predeterminados
-assigned_group = {}  # Diccionario para rastrear grupos asignados
-device_count = 0  # Contador de dispositivos en el grupo actual
-
-for index, row in df.iterrows():
-    if pd.isna(row.get("grupo")):  # Si no tiene grupo asignado
-        if device_count >= group_size:  # Si el grupo alcanza el tamaño maximo
-            group_counter += 1  # Incrementar el contador de grupos
-            device_count = 0  # Reiniciar el contador de dispositivos
-        new_group = f"GROUP{group_counter}"
-        df.at[index, "grupo"] = new_group
-        device_count += 1
-    else:
-        assigned_group[row["grupo"]] = assigned_group.get(row["grupo"], 0) + 1
-
-# Lista de subredes ya asignadas por razon_social
-subnets_by_client = df.dropna(subset=["razon_social", "subred"]).set_index("razon_social")["subred"].to_dict()
-
-# Generar subredes no usadas
-used_subnets = set(subnets_by_client.values())
-available_subnets = (str(subnet) for subnet in base_network.subnets(new_prefix=subnet_prefix))
-unused_subnets = (subnet for subnet in available_subnets if subnet not in used_subnets)
-
-# Identificar razones_sociales sin subred asignada y asignarles una subred unica
-for index, row in df.iterrows():
-    if pd.notna(row["grupo"]) and row["grupo"][:5] != "GROUP":
-        razon_social = row["grupo"]
-    elif pd.notna(row["razon_social"]):
-        razon_social = row["razon_social"]
-    else:
-        continue
-    
-    if pd.isna(row["subred"]):  # Si no tiene subred asignada
-        if razon_social in subnets_by_client:  # Si el razon_social ya tiene una subred conocida
-            df.at[index, "subred"] = subnets_by_client[razon_social]
-        else:  # Asignar nueva subred
-            try:
-                new_subnet = next(unused_subnets)
-            except StopIteration:
-                raise ValueError("No hay mas subredes disponibles para asignar.")
-            df.at[index, "subred"] = new_subnet
-            subnets_by_client[razon_social] = new_subnet  # Actualizar el registro de subredes asignadas
-
-# Generar IP unica dentro de cada subred
-used_ips = set(df["ip"].dropna())
-
-for index, row in df.iterrows():
-    subred = row["subred"]
-    if pd.isna(row["ip"]) and pd.notna(row["subred"]):
-        red = ipaddress.IPv4Network(subred, strict=False)
-        for ip in red.hosts():
-            if str(ip) not in used_ips:
-                used_ips.add(str(ip))
-                df.at[index, "ip"] = str(ip)
-                break
-
-# Generar nombres de VPN
-df["nombre_vpn"] = df.apply(
-    lambda row: generate_vpn_name(row["punto_de_venta"]) if pd.notna(row["ip"]) else None,
-    axis=1
-)
-
-# Cargar el archivo Excel existente con openpyxl para mantener su formato
-workbook = load_workbook(database_path)
-worksheet = workbook.active
-
-# Escribir datos actualizados en el archivo Excel sin alterar su formato
-for index, row in df.iterrows():
-    worksheet[f"A{index + 2}"] = row["grupo"] # Ajusta las columnas segun tu archivo
-    worksheet[f"B{index + 2}"] = row["subred"]
-    worksheet[f"C{index + 2}"] = row["razon_social"]
-    worksheet[f"D{index + 2}"] = row["punto_de_venta"]
-    worksheet[f"E{index + 2}"] = row["nombre_vpn"]
-    worksheet[f"F{index + 2}"] = row["ip"]
-
-# Guardar el archivo Excel actualizado en la ruta de salida
-workbook.save(output_excel)
-
-# Guardar un archivo CSV basado en el DataFrame en la ruta de salida
-df.to_csv(output_csv, index=False)
-
-print(f"Archivos actualizados guardados en:\n- {output_excel}\n- {output_csv}")
+    nombres = nombres.str.upper().astype(object)
+
+    # Nombre predeterminado si no hay punto_de_venta
+    return nombres.mask(texto.isna() | (texto == ""), "VPN_DEFAULT")
+
+
+def assign_network(df, settings):
+    """Fills in groups, subnets, IPs and VPN names. Returns the updated DataFrame.
+
+    With `allocation_db` set, subnets and IPs are allocated from that SQLite
+    index in one transaction instead of from the spreadsheet alone.
+    """
+    if settings.allocation_db is None:
+        return _assign_network(df, settings)
+    with AllocationStore(settings.allocation_db) as store, store.transaction():
+        return _assign_network(df, settings, store)
+
+
+def _assign_network(df, settings, store=None):
+    assigner = NetworkAssigner(settings, store)
+    assigner.seed(df)
+    return assigner.assign(df)
+
+
+class NetworkAssigner:
+    """Assigns groups, subnets, IPs and VPN names to a DataFrame or to a database read in batches of rows.
+
+    seed() must see every row before the first assign(), so the subnets and
+    IPs already used anywhere in the database are reserved first. Between
+    batches only the group counter, the subnet of each client and the
+    allocators (used subnets and IPs as integers) are kept.
+    """
+
+    def __init__(self, settings, store=None):
+        # `settings`: valores ya validados de config.ini (settings.Settings)
+        self.group_size = settings.default_group_size
+
+        # Familias a asignar: IPv4 siempre, IPv6 (columnas subred6/ip6) si hay base_network6
+        self.families = [("subred", "ip", settings.base_network, settings.subnet_prefix, 4)]
+        if settings.base_network6 is not None:
+            self.families.append(("subred6", "ip6", settings.base_network6, settings.subnet_prefix6, 6))
+
+        self.store = store
+        self.ungrouped = 0  # Filas sin grupo vistas en los lotes anteriores
+        # Subred de cada razon_social en la planilla, por familia (con indice SQLite se importa al asignar)
+        self.subnets_by_client = [{} for _ in self.families]
+        self.allocators = [
+            IPAllocator(base, prefix) if store is None else store.allocator(base, prefix)
+            for _, _, base, prefix, _ in self.families
+        ]
+
+    def _prepare(self, df):
+        # Las columnas vacias se leen como float: pasarlas a object antes de escribir texto en ellas
+        for column in ["grupo", "subred", "nombre_vpn", "ip"] + [column for family in self.families[1:] for column in family[:2]]:
+            df[column] = df[column].astype(object) if column in df else None
+
+    def seed(self, df):
+        """Reserves the subnets and IPs already present in `df` (the whole database or one batch)."""
+        self._prepare(df)
+        with timer("netconfig.seed"):
+            for (subnet_column, ip_column, *_, family), subnets_by_client, allocator in zip(
+                self.families, self.subnets_by_client, self.allocators
+            ):
+                # Subredes ya asignadas por razon_social (la ultima fila gana) y subredes e IPs usadas
+                subnets_by_client.update(
+                    df.dropna(subset=["razon_social", subnet_column]).set_index("razon_social")[subnet_column].to_dict()
+                )
+                if self.store is None:
+                    allocator.mark_columns(df[subnet_column], df[ip_column])
+                else:
+                    # El indice SQLite manda: se le agregan los valores de la planilla
+                    self.store.import_addresses(df, subnet_column, ip_column)
+
+    def assign(self, df):
+        """Fills in groups, subnets, IPs and VPN names. Returns the updated DataFrame."""
+        self._prepare(df)
+        if self.store is not None and any(self.subnets_by_client):
+            # Primera asignacion: pasar al indice las subredes por cliente de toda la planilla
+            for (*_, family), subnets_by_client in zip(self.families, self.subnets_by_client):
+                self.store.import_clients(subnets_by_client.items(), family)
+                subnets_by_client.clear()
+
+        # Asignar grupos predeterminados si no estan definidos, en bloques de group_size dispositivos
+        with timer("netconfig.groups"):
+            sin_grupo = df["grupo"].isna()
+            posicion = sin_grupo.cumsum()[sin_grupo] - 1 + self.ungrouped  # Posicion de cada fila dentro de las filas sin grupo
+            df.loc[sin_grupo, "grupo"] = "GROUP" + (posicion // self.group_size + 1).astype(str)
+            self.ungrouped += int(sin_grupo.sum())
+
+        with timer("netconfig.subnets"):
+            # Un grupo propio (no GROUPn) comparte subred; si no, la subred es por razon_social
+            grupo_propio = df["grupo"].notna() & (df["grupo"].astype(str).str[:5] != "GROUP")
+            clientes = df["grupo"].where(grupo_propio, df["razon_social"])
+            for family, subnets_by_client, allocator in zip(self.families, self.subnets_by_client, self.allocators):
+                self._assign_subnets(df, clientes, family, subnets_by_client, allocator)
+
+        # Generar IP unica dentro de cada subred, en el orden de las filas
+        with timer("netconfig.ips"):
+            for (subnet_column, ip_column, *_), allocator in zip(self.families, self.allocators):
+                sin_ip = df[ip_column].isna() & df[subnet_column].notna()
+                df.loc[sin_ip, ip_column] = [allocator.allocate_host(subred) for subred in df.loc[sin_ip, subnet_column]]
+
+        # Generar nombres de VPN
+        with timer("netconfig.names"):
+            df["nombre_vpn"] = generate_vpn_names(df["punto_de_venta"]).where(df["ip"].notna(), None)
+
+        return df
+
+    def _assign_subnets(self, df, clientes, family, subnets_by_client, allocator):
+        """Gives a subnet to every client without one, in order of appearance.
+
+        Addresses are handled as integers, so an IPv6 /64 costs the same as an IPv4 /27.
+        """
+        subnet_column, _, _, _, version = family
+        if self.store is not None:
+            # Con el indice SQLite se consulta la subred de los clientes de estas filas
+            subnets_by_client = self.store.client_subnets(clientes.dropna().unique(), version)
+            known_clients = set(subnets_by_client)
+
+        # Identificar clientes sin subred asignada y asignarles una subred unica
+        sin_subred = clientes.notna() & df[subnet_column].isna()
+        for cliente in clientes[sin_subred].unique():
+            if cliente not in subnets_by_client:
+                subnets_by_client[cliente] = allocator.allocate_subnet()
+        df.loc[sin_subred, subnet_column] = clientes[sin_subred].map(subnets_by_client)
+        if self.store is not None:
+            self.store.save_client_subnets(
+                {client: subnet for client, subnet in subnets_by_client.items() if client not in known_clients}, version
+            )
+
+
+def save_database(df, settings):
+    """Writes the updated database to the output folder, in its own format and as CSV."""
+    output_database, output_csv = netconfig_output_paths(settings)
+
+    # Asegurarse de que la carpeta de salida exista
+    os.makedirs(os.path.dirname(output_database), exist_ok=True)
+
+    # Guardar la base de datos actualizada en la ruta de salida (un .xlsx conserva el formato del original)
+    storage.save_database(df, output_database, template=settings.database_path)
+
+    # Guardar un archivo CSV basado en el DataFrame en la ruta de salida
+    if output_csv != output_database:
+        with replacing(output_csv) as tmp_path:
+            df.to_csv(tmp_path, index=False)
+
+    print(f"Archivos actualizados guardados en:\n- {output_database}\n- {output_csv}")
+
+
+def run(settings, df=None, save=True):
+    """Runs the netconfig stage. Reads the database unless a DataFrame is given."""
+    if df is None:
+        df = storage.load_database(settings.database_path)
+    df = assign_network(df, settings)
+    if save:
+        save_database(df, settings)
+    return df
+
+
+def main():
+    settings = validate(load_config())
+    with run_lock(settings):
+        run(settings)
+
+
+if __name__ == "__main__":
+    main()
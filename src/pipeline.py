@@ -0,0 +1,259 @@
+import netconfig
+import wireguardconfig
+import mikrotikconfig
+import manifest
+import instrumentation
+import os
+import storage
+import time
+from allocdb import AllocationStore
+from bundles import export_options
+from contextlib import ExitStack
+from settings import manifest_path, mikrotik_output_path, reports_path, run_lock, validate, wireguard_output_paths
+
+
+class PipelineCancelled(Exception):
+    """Raised when a run is cancelled through its `cancel` event."""
+
+
+def check_cancelled(context):
+    """Stops the run if cancellation was requested. Called between stages and long steps."""
+    cancel = context.get("cancel")
+    if cancel is not None and cancel.is_set():
+        raise PipelineCancelled("Ejecucion cancelada por el usuario.")
+
+
+def netconfig_stage(config, df, context):
+    """Assigns groups, subnets and IPs. The intermediate Excel/CSV files are not written."""
+    return netconfig.run(context["settings"], df, save=False)
+
+
+def wireguard_stage(config, df, context):
+    """Generates keys and peer configs, then saves the database and CSV files.
+
+    In incremental runs only the .conf files of new or changed rows are written.
+    """
+    settings = context["settings"]
+    df = wireguardconfig.assign_keys(df, settings, stats=context["stats"])
+    check_cancelled(context)
+    if context.get("incremental"):
+        context["digests"] = manifest.row_digests(df)
+        context["changed"] = manifest.changed_rows(df, context["digests"], context["manifest"])
+    context["stats"]["files"] = wireguardconfig.write_peer_configs(df, settings, only=context.get("changed"))
+    return wireguardconfig.save_database(df, settings)
+
+
+def mikrotik_stage(config, df, context):
+    """Generates the MikroTik scripts from the DataFrame.
+
+    In incremental runs mikrotik_address_delta.rsc / mikrotik_peers_delta.rsc
+    are written as well, with only the new or changed rows. The full scripts
+    are always regenerated, so they match the database after every run.
+    """
+    mikrotikconfig.run(context["settings"], df)
+    changed = context.get("changed")
+    if changed is not None:
+        write_delta_scripts(context["settings"], mikrotikconfig.dataframe_rows(df[changed]))
+    return df
+
+
+def write_delta_scripts(settings, rows):
+    """Writes the _delta scripts for the changed `rows` (Peer records), or removes the old ones if there are none."""
+    if rows:
+        mikrotikconfig.generate_scripts(rows, settings, suffix="_delta")
+        return
+    # Borrar los scripts delta anteriores para no volver a importarlos por error
+    for script in ["mikrotik_address_delta.rsc", "mikrotik_peers_delta.rsc"]:
+        script_path = os.path.join(mikrotik_output_path(settings), script)
+        if os.path.exists(script_path):
+            os.remove(script_path)
+        print(f"Script de MikroTik sin cambios desde la ultima ejecucion (no se genera): {script_path}")
+
+
+DEFAULT_STAGES = [
+    ("netconfig", netconfig_stage),
+    ("wireguardconfig", wireguard_stage),
+    ("mikrotikconfig", mikrotik_stage),
+]
+
+
+class Pipeline:
+    """Runs the MikroGuard stages in a single process, passing one DataFrame from stage to stage.
+
+    The config is validated when the pipeline is created (settings.ConfigError
+    on bad values), and the resulting Settings reach every stage as
+    context["settings"].
+
+    With `batch_rows` in [netconfig] the default stages read the database in
+    batches of that many rows instead of as one DataFrame (see _run_batches).
+    """
+
+    def __init__(self, config, stages=None, incremental=None, profile=False):
+        self.config = config
+        self.settings = validate(config, check_paths=False)
+        self.stages = list(stages or DEFAULT_STAGES)
+        if incremental is None:
+            incremental = self.settings.incremental
+        self.incremental = incremental
+        self.profile = profile
+        self.report_path = None
+        self.rows = 0  # Filas procesadas en la ultima ejecucion
+
+    def run(self, df=None, on_stage_done=None, on_event=None, cancel=None):
+        """Runs every stage in order and returns the final DataFrame (None in chunked runs).
+
+        `on_stage_done(name)` is called after each stage finishes. `on_event(event)`
+        receives a dict per stage start and end: {"stage", "event": "start"|"done"},
+        plus "rows", "elapsed" and the stage counters ("keys", "files") on "done".
+        Setting the `cancel` event (threading.Event) stops the run with
+        PipelineCancelled at the next check. Exceptions raised by a stage stop
+        the pipeline and are propagated to the caller. In incremental runs the
+        manifest is only updated once every stage succeeded, so a failed or
+        cancelled run is fully retried next time.
+
+        Every run writes a JSON report with the timings and counters of each
+        sub-step to output/reports/ (unless run_report = false in [output]);
+        with `profile` a cProfile .pstats file is written next to it.
+
+        The run holds the locks of settings.run_lock_paths, so two runs against
+        the same database or output folder never interleave their allocations
+        and writes; the second one waits up to lock_timeout seconds.
+        """
+        recorder = instrumentation.Recorder()
+        stem = os.path.join(reports_path(self.settings), instrumentation.report_stem(recorder))
+        status = "error"
+        try:
+            # Otra ejecucion sobre la misma base de datos o carpeta de salida: esperar a que termine
+            with run_lock(self.settings), instrumentation.recording(recorder), \
+                    instrumentation.profiled(stem + ".pstats" if self.profile else None):
+                df = self._run_stages(df, on_stage_done, on_event, cancel, recorder)
+            status = "ok"
+            return df
+        except PipelineCancelled:
+            status = "cancelled"
+            raise
+        finally:
+            if self.settings.run_report:
+                self.report_path = instrumentation.write_report(
+                    stem + ".json", recorder,
+                    version=self.config.get("metadata", "version", fallback=None),
+                    database=self.settings.database_path,
+                    incremental=self.incremental,
+                    status=status,
+                )
+
+    def _run_stages(self, df, on_stage_done, on_event, cancel, recorder):
+        context = {"settings": self.settings, "incremental": self.incremental, "cancel": cancel}
+        if self.incremental:
+            context["manifest"] = manifest.load_manifest(manifest_path(self.settings))
+        if df is None and self.settings.batch_rows and self.stages == DEFAULT_STAGES:
+            return self._run_batches(context, on_stage_done, on_event, recorder)
+
+        for name, stage in self.stages:
+            df = self._step(name, lambda: stage(self.config, df, context), context, recorder, on_stage_done, on_event)
+
+        check_cancelled(context)
+        if self.incremental and "digests" in context:
+            manifest.save_manifest(manifest_path(self.settings), df, context["digests"])
+        self.rows = len(df)
+        recorder.count("rows", self.rows)
+        return df
+
+    def _step(self, name, function, context, recorder, on_stage_done, on_event):
+        """Runs one stage, or one batch of rows, between its start and done events. Returns what `function` returns.
+
+        Steps that return no DataFrame report the rows of the whole database (self.rows).
+        """
+        check_cancelled(context)
+        if on_event is not None:
+            on_event({"stage": name, "event": "start"})
+        context["stats"] = {}
+        start = time.perf_counter()
+        # Los lotes ("batch 1", "batch 2", ...) suman su tiempo en stage.batch
+        with recorder.timer(f"stage.{name.split()[0]}"):
+            df = function()
+        if on_event is not None:
+            rows = self.rows if df is None else len(df)
+            on_event({"stage": name, "event": "done", "rows": rows, "elapsed": time.perf_counter() - start, **context["stats"]})
+        if on_stage_done is not None:
+            on_stage_done(name)
+        return df
+
+    def _run_batches(self, context, on_stage_done, on_event, recorder):
+        """Chunked run for very large databases: at most batch_rows rows are in memory at a time.
+
+        The database is read twice in batches. The first pass ("seed") only
+        reserves the subnets and IPs already in use; the second assigns
+        groups, subnets, IPs and keys, writes the .conf files and appends the
+        rows to the output files ("batch 1", "batch 2", ...). Between batches
+        only the allocation state is kept. The output files replace the old
+        ones once every batch succeeded, and the MikroTik scripts (and the
+        zip/tar archive or QR codes, if enabled) are then built from the CSV.
+        """
+        settings, batch_rows = self.settings, self.settings.batch_rows
+        backend = storage.get_backend(self.settings.database_path)
+        tunnels_format, _, qr_codes = export_options(settings)
+        seen, new_manifest, delta = {}, {}, []
+
+        def seed():
+            for df in backend.iter_chunks(batch_rows):
+                check_cancelled(context)
+                assigner.seed(df)
+                self.rows += len(df)
+
+        def process(df):
+            df = assigner.assign(df)
+            df = wireguardconfig.assign_keys(df, settings, store, files, context["stats"])
+            check_cancelled(context)
+            changed = None
+            if self.incremental:
+                digests = manifest.row_digests(df)
+                keys = manifest.row_keys(df, seen)
+                changed = manifest.changed_rows(df, digests, context["manifest"], keys)
+                new_manifest.update(manifest.manifest_entries(df, digests, keys))
+                delta.extend(mikrotikconfig.dataframe_rows(df[changed]))
+            if tunnels_format == "files":
+                context["stats"]["files"] = wireguardconfig.write_tunnel_files(df, settings, changed, files)
+            write(df)
+            return df
+
+        with ExitStack() as stack:
+            write = stack.enter_context(wireguardconfig.database_writer(settings))
+            store = None
+            db_path = self.settings.allocation_db
+            if db_path is not None:
+                # Una sola transaccion para toda la ejecucion, compartida por netconfig y WireGuard
+                store = stack.enter_context(AllocationStore(db_path))
+                stack.enter_context(store.transaction())
+                store.freeze_keys()
+            assigner = netconfig.NetworkAssigner(settings, store)
+            files = wireguardconfig.ConfigFiles(settings)
+
+            self.rows = 0
+            self._step("seed", seed, context, recorder, on_stage_done, on_event)
+            for number, df in enumerate(backend.iter_chunks(batch_rows), 1):
+                instrumentation.count("rows.read", len(df))
+                self._step(f"batch {number}", lambda: process(df), context, recorder, on_stage_done, on_event)
+            files.save()
+            check_cancelled(context)
+
+        _, output_csv, _ = wireguard_output_paths(settings)
+        if tunnels_format != "files" or qr_codes is not None:
+            def frames():
+                return storage.get_backend(output_csv).iter_chunks(batch_rows)
+
+            def export():
+                context["stats"]["files"] = wireguardconfig.export_tunnels(frames, settings, *export_options(settings))
+
+            self._step("export", export, context, recorder, on_stage_done, on_event)
+
+        def mikrotik():
+            mikrotikconfig.run(settings)
+            if self.incremental:
+                write_delta_scripts(settings, delta)
+
+        self._step("mikrotikconfig", mikrotik, context, recorder, on_stage_done, on_event)
+        check_cancelled(context)
+        if self.incremental:
+            manifest.write_manifest(manifest_path(self.settings), new_manifest)
+        recorder.count("rows", self.rows)
@@ -0,0 +1,376 @@
+"""Pushes subnets and WireGuard peers straight to MikroTik routers over the RouterOS API.
+
+An alternative to importing mikrotik_address.rsc/mikrotik_peers.rsc by hand.
+For every router in [routeros] the existing addresses and peers are read once
+(one pipelined round trip), the diff against the WireGuard CSV is computed
+locally, and only the missing entries are added: the commands are split into
+batches, every batch is pipelined on one connection of a small pool, and
+several routers are handled at the same time.
+
+Usage: python src/routeros.py [--router 192.0.2.1 --router 192.0.2.2:8729] [--dry-run]
+"""
+import argparse
+import hashlib
+import ipaddress
+import queue
+import socket
+import ssl
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from instrumentation import count, timer
+from settings import load_config, split_router, validate, wireguard_output_paths
+
+API_PORT = 8728
+API_TLS_PORT = 8729
+
+
+class RouterOSError(Exception):
+    """A command answered with !trap (e.g. a duplicated address)."""
+
+
+def encode_length(length):
+    """Length prefix of a word in the RouterOS API protocol (1 to 5 bytes)."""
+    if length < 0x80:
+        return length.to_bytes(1, "big")
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + length.to_bytes(4, "big")
+
+
+def encode_sentence(words):
+    """Encodes a sentence: every word with its length, then an empty word."""
+    data = bytearray()
+    for word in words:
+        encoded = word.encode("utf-8")
+        data += encode_length(len(encoded))
+        data += encoded
+    data += b"\x00"
+    return bytes(data)
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ConnectionError("El router cerro la conexion.")
+    return data
+
+
+def read_length(stream):
+    first = _read_exact(stream, 1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | _read_exact(stream, 1)[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(_read_exact(stream, 2), "big")
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(_read_exact(stream, 3), "big")
+    return int.from_bytes(_read_exact(stream, 4), "big")
+
+
+def read_sentence(stream):
+    """Reads one sentence from a buffered binary stream. Returns its words."""
+    words = []
+    while True:
+        length = read_length(stream)
+        if length == 0:
+            return words
+        words.append(_read_exact(stream, length).decode("utf-8", errors="replace"))
+
+
+def parse_reply(words):
+    """Splits a reply sentence into (type, tag, attributes): ("!re", "3", {"address": ...})."""
+    attributes = {}
+    tag = None
+    for word in words[1:]:
+        if word.startswith(".tag="):
+            tag = word[5:]
+        elif word.startswith("="):
+            key, _, value = word[1:].partition("=")
+            attributes[key] = value
+    return words[0], tag, attributes
+
+
+class ApiConnection:
+    """One logged-in RouterOS API session. Not thread safe: use one per thread (see ConnectionPool)."""
+
+    def __init__(self, host, port=None, username="admin", password="", tls=False, timeout=10):
+        self.host = host
+        port = port or (API_TLS_PORT if tls else API_PORT)
+        sock = socket.create_connection((host, port), timeout=timeout)
+        if tls:
+            # RouterOS suele usar un certificado propio sin CA: se cifra sin verificarlo
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=host)
+        self.socket = sock
+        self.stream = sock.makefile("rb")
+        self._tag = 0
+        self.login(username, password)
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+    def login(self, username, password):
+        reply = self.talk(["/login", f"=name={username}", f"=password={password}"])
+        challenge = reply[0].get("ret") if reply else None
+        if challenge:
+            # RouterOS anterior a 6.43: login con desafio MD5
+            digest = hashlib.md5(b"\x00" + password.encode("utf-8") + bytes.fromhex(challenge)).hexdigest()
+            self.talk(["/login", f"=name={username}", f"=response=00{digest}"])
+
+    def talk(self, words):
+        """Sends one command and waits for it. Returns the attributes of its !re (and !done) replies."""
+        return self.pipeline([words])[0]
+
+    def pipeline(self, commands, check=True):
+        """Sends every command before reading any reply. Returns one result per command, in order.
+
+        A result is the list of attribute dicts of the command's !re replies,
+        followed by the attributes of !done when it has any (e.g. =ret= of an
+        add). With check=False a !trap gives a RouterOSError as the result
+        instead of raising it.
+        """
+        tags = []
+        data = bytearray()
+        for words in commands:
+            self._tag += 1
+            tags.append(str(self._tag))
+            data += encode_sentence([*words, f".tag={self._tag}"])
+        self.socket.sendall(data)
+
+        results = {tag: [] for tag in tags}
+        pending = set(tags)
+        while pending:
+            kind, tag, attributes = parse_reply(read_sentence(self.stream))
+            if kind == "!fatal":
+                raise ConnectionError(f"{self.host}: {attributes.get('message', 'error fatal')}")
+            if tag not in pending:
+                continue
+            if kind == "!re":
+                results[tag].append(attributes)
+            elif kind == "!trap":
+                results[tag] = RouterOSError(f"{self.host}: {attributes.get('message', 'error')}")
+            elif kind == "!done":
+                if attributes and not isinstance(results[tag], RouterOSError):
+                    results[tag].append(attributes)
+                pending.discard(tag)
+        ordered = [results[tag] for tag in tags]
+        if check:
+            for result in ordered:
+                if isinstance(result, RouterOSError):
+                    raise result
+        return ordered
+
+
+class ConnectionPool:
+    """Up to `size` logged-in connections to one router, opened on demand and reused."""
+
+    def __init__(self, host, port=None, size=4, **options):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.options = options
+        self._idle = queue.LifoQueue()
+        self._all = []
+
+    @contextmanager
+    def connection(self):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = ApiConnection(self.host, self.port, **self.options)
+            self._all.append(connection)
+        try:
+            yield connection
+        except BaseException:
+            # Una conexion con un error a mitad de respuesta no se reutiliza
+            self._all.remove(connection)
+            connection.close()
+            raise
+        self._idle.put(connection)
+
+    def close(self):
+        for connection in self._all:
+            connection.close()
+        self._all.clear()
+
+
+def _addresses(value):
+    """Normalized addresses of an address or allowed-address list ("10.0.0.2,fd00::2" -> {"10.0.0.2/32", ...})."""
+    addresses = set()
+    for part in str(value).split(","):
+        part = part.strip()
+        if part:
+            try:
+                addresses.add(str(ipaddress.ip_interface(part)))
+            except ValueError:
+                addresses.add(part)
+    return addresses
+
+
+STATE_COMMANDS = [
+    ["/ip/address/print", "=.proplist=address"],
+    ["/ipv6/address/print", "=.proplist=address"],
+    ["/interface/wireguard/peers/print", "=.proplist=public-key,allowed-address"],
+]
+
+
+def fetch_state(connection):
+    """Reads the router's addresses and peers in one pipelined round trip.
+
+    Returns (addresses on the router, public keys of the peers, addresses allowed to a peer).
+    """
+    addresses, addresses6, peers = connection.pipeline(STATE_COMMANDS)
+    existing = set()
+    for item in addresses + addresses6:
+        existing |= _addresses(item.get("address", ""))
+    public_keys = {item["public-key"] for item in peers if item.get("public-key")}
+    allowed = set()
+    for item in peers:
+        allowed |= _addresses(item.get("allowed-address", ""))
+    return existing, public_keys, allowed
+
+
+def missing_commands(addresses, peers, state, interface):
+    """API commands that add the addresses and peers the router does not have yet.
+
+    Same rules as the .rsc scripts: a subnet is skipped if the router already
+    has it, a peer if its public key or one of its IPs is already in use.
+    """
+    existing, public_keys, allowed = state
+    commands = []
+    for address in addresses:
+        if address.subred and not _addresses(address.subred) & existing:
+            commands.append([
+                "/ip/address/add", f"=address={address.subred}", f"=interface={interface}",
+                f"=comment=WG {address.razon_social}",
+            ])
+        if address.subred6 and not _addresses(address.subred6) & existing:
+            commands.append([
+                "/ipv6/address/add", f"=address={address.subred6}", f"=interface={interface}",
+                "=advertise=no", f"=comment=WG {address.razon_social}",
+            ])
+    for peer in peers:
+        ip_list = ",".join(filter(None, [peer.ip, peer.ip6]))
+        if peer.clave_publica in public_keys or _addresses(ip_list) & allowed:
+            continue
+        commands.append([
+            "/interface/wireguard/peers/add", f"=name={peer.nombre_vpn}", f"=public-key={peer.clave_publica}",
+            f"=allowed-address={ip_list}", f"=interface={interface}", "=persistent-keepalive=30s",
+        ])
+    return commands
+
+
+def push(pool, commands, batch_size=200):
+    """Sends the commands in pipelined batches over the pool's connections. Returns the error messages."""
+    batches = [commands[i:i + batch_size] for i in range(0, len(commands), batch_size)]
+
+    def send(batch):
+        with pool.connection() as connection:
+            return connection.pipeline(batch, check=False)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for results in executor.map(send, batches):
+            errors.extend(str(result) for result in results if isinstance(result, RouterOSError))
+    return errors
+
+
+def deploy_router(router, addresses, peers, options):
+    """Diffs and pushes one router. Returns a summary dict (never raises)."""
+    start = time.perf_counter()
+    summary = {"router": router, "added": 0, "skipped": 0, "errors": []}
+    try:
+        host, port = split_router(router)
+    except ValueError as e:
+        summary["errors"].append(str(e))
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+    pool = ConnectionPool(
+        host, port, size=options["pool_size"], username=options["username"],
+        password=options["password"], tls=options["tls"], timeout=options["timeout"],
+    )
+    try:
+        with pool.connection() as connection:
+            state = fetch_state(connection)
+        commands = missing_commands(addresses, peers, state, options["interface"])
+        wanted = sum(bool(address.subred) + bool(address.subred6) for address in addresses) + len(peers)
+        summary["skipped"] = wanted - len(commands)
+        if not options["dry_run"]:
+            summary["errors"] = push(pool, commands, options["batch_size"])
+        summary["added"] = len(commands) - len(summary["errors"])
+    except (OSError, RouterOSError) as e:
+        summary["errors"].append(f"{router}: {e}")
+    finally:
+        pool.close()
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def deploy_options(settings, dry_run=False):
+    """Returns the [routeros] options (and the WireGuard interface name) of the validated settings."""
+    return {
+        "interface": settings.interface,
+        "username": settings.routeros_username,
+        "password": settings.routeros_password,
+        "tls": settings.routeros_tls,
+        "timeout": settings.routeros_timeout,
+        "pool_size": settings.routeros_pool_size,
+        "batch_size": settings.routeros_batch_size,
+        "dry_run": dry_run,
+    }
+
+
+def deploy(settings, rows, routers=None, dry_run=False):
+    """Pushes the subnets and peers of `rows` (Peer records) to every router. Returns one summary per router."""
+    from mikrotikconfig import collect
+
+    if routers is None:
+        routers = list(settings.routers)
+    if not routers:
+        raise ValueError("No hay routers configurados en [routeros] routers.")
+    options = deploy_options(settings, dry_run)
+    with timer("routeros.collect"):
+        addresses, peers = collect(rows)
+    with timer("routeros.push"), ThreadPoolExecutor(max_workers=len(routers)) as executor:
+        summaries = list(executor.map(lambda router: deploy_router(router, addresses, peers, options), routers))
+    for summary in summaries:
+        count("routeros.added", summary["added"])
+        count("routeros.errors", len(summary["errors"]))
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--router", action="append", default=None,
+        help="host, host:port or [IPv6]:port of a router. Repeat for several routers (default: routers in [routeros])",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only read the routers and print what would be added")
+    args = parser.parse_args()
+
+    from mikrotikconfig import read_rows
+
+    settings = validate(load_config(), check_paths=False)
+    _, input_csv, _ = wireguard_output_paths(settings)
+    failed = 0
+    for summary in deploy(settings, read_rows(input_csv), args.router, args.dry_run):
+        verb = "por agregar" if args.dry_run else "agregados"
+        print(f"[{summary['router']}] {summary['added']} {verb}, {summary['skipped']} ya existian ({summary['seconds']:.2f} s)")
+        for error in summary["errors"]:
+            print(f"[{summary['router']}] ERROR: {error}", file=sys.stderr)
+        failed += bool(summary["errors"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+import base64
+import binascii
+import configparser
+import ipaddress
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from fsutil import file_locks, lock_path
+
+# Ruta del archivo de configuracion usada cuando los scripts se ejecutan por separado
+CONFIG_PATH = "src/config.ini"
+
+# Valor de ejemplo que la GUI escribe en un config.ini nuevo: hay que reemplazarlo por la clave del router
+PLACEHOLDER_PUBLIC_KEY = "default_public_key"
+
+# Formatos de base de datos soportados por storage.py (sin importar pandas para validarlos)
+DATABASE_EXTENSIONS = (".xlsx", ".csv", ".parquet")
+
+_HOSTNAME = re.compile(r"^(?=.{1,253}$)([A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?)(\.[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*$")
+
+
+class ConfigError(ValueError):
+    """config.ini has invalid values. The message lists every problem found."""
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Typed, validated view of config.ini. Build it with validate()."""
+
+    base_network: ipaddress.IPv4Network
+    subnet_prefix: int
+    base_network6: ipaddress.IPv6Network | None
+    subnet_prefix6: int
+    database_path: str
+    default_group_size: int
+    batch_rows: int
+    interface: str
+    allocation_db: str | None
+    router_public_key: str
+    endpoint: str
+    port: int
+    key_backend: str
+    io_workers: int
+    atomic_writes: bool
+    key_pool: str | None
+    key_pool_size: int
+    key_pool_encrypt: bool
+    output_path: str
+    incremental: bool
+    export_xlsx: bool
+    run_report: bool
+    lock_timeout: int
+    tunnels_format: str
+    bundle_groups: str
+    qr_codes: str
+    lookup: str
+    chunk_size: int
+    routers: tuple
+    routeros_username: str
+    routeros_password: str = field(repr=False)
+    routeros_tls: bool
+    routeros_timeout: int
+    routeros_pool_size: int
+    routeros_batch_size: int
+
+
+def load_config(config_path=CONFIG_PATH):
+    """Reads config.ini. Cheap: does not import pandas/openpyxl nor touch the output folders."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return config
+
+
+def netconfig_output_paths(settings):
+    """Returns the database copy (same format as the input) and the CSV written by the netconfig stage."""
+    database_path = settings.database_path
+    output_path = settings.output_path + "/db/"
+    output_database = os.path.join(output_path, os.path.basename(database_path))
+    output_csv = os.path.join(output_path, os.path.splitext(os.path.basename(database_path))[0] + ".csv")
+    return output_database, output_csv
+
+
+def wireguard_output_paths(settings):
+    """Returns the peers directory and the CSV files written by the WireGuard stage."""
+    database_path = settings.database_path
+    output_peers_directory = os.path.join(settings.output_path, "tunnels/")  # Directorio para los archivos de los peers WireGuard
+    output_csv = os.path.splitext(database_path)[0] + ".csv"  # Directorio para el archivo CSV
+    output_connect_csv = os.path.splitext(database_path)[0] + "_rdc.csv"
+    return output_peers_directory, output_csv, output_connect_csv
+
+
+def xlsx_export_path(settings):
+    """Returns the optional .xlsx export written next to a CSV/Parquet database."""
+    return os.path.splitext(settings.database_path)[0] + ".xlsx"
+
+
+def mikrotik_output_path(settings):
+    """Returns the folder for the MikroTik scripts."""
+    return settings.output_path + "/mikrotik/"
+
+
+def reports_path(settings):
+    """Returns the folder for the JSON run reports (and the --profile pstats files)."""
+    return settings.output_path + "/reports/"
+
+
+def manifest_path(settings):
+    """Returns the manifest with the per-row hashes used by incremental runs."""
+    output_path = settings.output_path + "/db/"
+    return os.path.join(output_path, os.path.splitext(os.path.basename(settings.database_path))[0] + ".manifest.json")
+
+
+def run_lock_paths(settings):
+    """Returns the lock files held during a run: one next to the database and one in the output folder.
+
+    Runs against the same database or output folder wait for each other;
+    runs of other tenants (other paths) are not affected.
+    """
+    return [lock_path(settings.database_path), os.path.join(settings.output_path, ".mikroguard.lock")]
+
+
+def run_lock(settings):
+    """Context manager that holds the run_lock_paths locks, waiting up to lock_timeout seconds for them."""
+    return file_locks(run_lock_paths(settings), settings.lock_timeout)
+
+
+def key_index_path(settings):
+    """Returns the cache of the keys read back from existing .conf files (see tunnels.KeyIndex)."""
+    output_path = settings.output_path + "/db/"
+    return os.path.join(output_path, os.path.splitext(os.path.basename(settings.database_path))[0] + ".keyindex")
+
+
+class _Reader:
+    """Reads options with the same fallbacks as the stages, collecting the errors instead of raising."""
+
+    def __init__(self, values):
+        self.values = values
+        self.errors = []
+
+    def error(self, section, option, message):
+        self.errors.append(f"[{section}] {option}: {message}")
+
+    def text(self, section, option, fallback=""):
+        return self.values.get(section, {}).get(option, fallback).strip()
+
+    def convert(self, section, option, fallback, convert):
+        value = self.text(section, option, fallback)
+        try:
+            return convert(value)
+        except ValueError as e:
+            self.error(section, option, f"{value!r} no es valido ({e})")
+            return None
+
+    def integer(self, section, option, fallback, minimum=None, maximum=None):
+        value = self.convert(section, option, fallback, int)
+        if value is None:
+            return None
+        if maximum is not None and not minimum <= value <= maximum:
+            self.error(section, option, f"{value} debe estar entre {minimum} y {maximum}")
+        elif minimum is not None and value < minimum:
+            self.error(section, option, f"{value} debe ser al menos {minimum}")
+        return value
+
+    def boolean(self, section, option, fallback):
+        value = self.text(section, option, fallback).lower()
+        if value not in configparser.ConfigParser.BOOLEAN_STATES:
+            self.error(section, option, f"{value!r} no es true/false")
+            return None
+        return configparser.ConfigParser.BOOLEAN_STATES[value]
+
+    def choice(self, section, option, fallback, choices):
+        value = self.text(section, option, fallback)
+        if value not in choices:
+            self.error(section, option, f"{value!r} debe ser uno de {', '.join(choices)}")
+        return value
+
+
+def _check_prefix(reader, section, option, network, prefix):
+    if network is not None and prefix is not None and not network.prefixlen <= prefix <= network.max_prefixlen:
+        reader.error(section, option, f"/{prefix} no entra en {network}")
+
+
+def _check_public_key(reader, value):
+    if value in ("", PLACEHOLDER_PUBLIC_KEY):
+        reader.error("wireguard", "public_key_custom_text", "falta la clave publica del router (wg show <interfaz> public-key)")
+        return
+    try:
+        valid = len(base64.b64decode(value, validate=True)) == 32
+    except (binascii.Error, ValueError):
+        valid = False
+    if not valid:
+        reader.error("wireguard", "public_key_custom_text", f"{value!r} no es una clave WireGuard (base64 de 32 bytes)")
+
+
+def _check_host(reader, section, option, value):
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        if not _HOSTNAME.match(value):
+            reader.error(section, option, f"{value!r} no es una IP ni un nombre de host")
+            return False
+    return True
+
+
+def split_router(router):
+    """Splits a `routers` entry into (host, port or None).
+
+    Accepts host, host:port, a bare IPv6 address or [IPv6]:port. Raises ValueError if it is malformed.
+    """
+    if router.startswith("["):
+        host, bracket, rest = router[1:].partition("]")
+        if not bracket or (rest and not rest.startswith(":")):
+            raise ValueError(f"{router!r} no es [IPv6] ni [IPv6]:puerto")
+        port = rest[1:]
+    elif router.count(":") == 1:
+        host, _, port = router.partition(":")
+    else:
+        # Nombre, IPv4 o IPv6 sin puerto (una IPv6 con puerto va entre corchetes)
+        host, port = router, ""
+    if port and not (port.isdigit() and 1 <= int(port) <= 65535):
+        raise ValueError(f"puerto invalido en {router!r}")
+    return host, int(port) if port else None
+
+
+def _check_router(reader, router):
+    try:
+        host, _ = split_router(router)
+    except ValueError as e:
+        reader.error("routeros", "routers", str(e))
+        return
+    _check_host(reader, "routeros", "routers", host)
+
+
+@lru_cache(maxsize=32)
+def _parse(snapshot):
+    """Builds the Settings of a config snapshot ((section, ((option, value), ...)), ...)."""
+    reader = _Reader({section: dict(options) for section, options in snapshot})
+    text, integer, boolean = reader.text, reader.integer, reader.boolean
+
+    base_network = reader.convert("netconfig", "base_network", "", ipaddress.IPv4Network)
+    subnet_prefix = integer("netconfig", "subnet_prefix", "")
+    _check_prefix(reader, "netconfig", "subnet_prefix", base_network, subnet_prefix)
+    base_network6 = None
+    if text("netconfig", "base_network6"):
+        base_network6 = reader.convert("netconfig", "base_network6", "", ipaddress.IPv6Network)
+    subnet_prefix6 = integer("netconfig", "subnet_prefix6", "64")
+    _check_prefix(reader, "netconfig", "subnet_prefix6", base_network6, subnet_prefix6)
+
+    database_path = text("netconfig", "database_path")
+    if os.path.splitext(database_path)[1].lower() not in DATABASE_EXTENSIONS:
+        reader.error("netconfig", "database_path", f"{database_path!r} debe ser {', '.join(DATABASE_EXTENSIONS)}")
+    interface = text("netconfig", "interface", "WG")
+    if not interface:
+        reader.error("netconfig", "interface", "no puede estar vacio")
+
+    router_public_key = text("wireguard", "public_key_custom_text")
+    _check_public_key(reader, router_public_key)
+    endpoint = text("wireguard", "endpoint_custom_text")
+    if endpoint.count(":") == 1:
+        # Versiones anteriores de la GUI guardaban "127.0.0.1:51820": el puerto va en port_custom_text
+        reader.error("wireguard", "endpoint_custom_text", f"{endpoint!r} no debe incluir el puerto (use port_custom_text)")
+    else:
+        _check_host(reader, "wireguard", "endpoint_custom_text", endpoint)
+
+    output_path = text("output", "output_path")
+    if not output_path:
+        reader.error("output", "output_path", "no puede estar vacio")
+
+    routers = tuple(router.strip() for router in text("routeros", "routers").split(",") if router.strip())
+    for router in routers:
+        _check_router(reader, router)
+
+    settings = dict(
+        base_network=base_network,
+        subnet_prefix=subnet_prefix,
+        base_network6=base_network6,
+        subnet_prefix6=subnet_prefix6,
+        database_path=database_path,
+        default_group_size=integer("netconfig", "default_group_size", "", minimum=1),
+        batch_rows=integer("netconfig", "batch_rows", "0", minimum=0),
+        interface=interface,
+        allocation_db=text("netconfig", "allocation_db") or None,
+        router_public_key=router_public_key,
+        endpoint=endpoint,
+        port=integer("wireguard", "port_custom_text", "", minimum=1, maximum=65535),
+        key_backend=reader.choice("wireguard", "key_backend", "native", ["native", "wg"]),
+        io_workers=integer("wireguard", "io_workers", "8", minimum=1),
+        atomic_writes=boolean("wireguard", "atomic_writes", "true"),
+        key_pool=text("wireguard", "key_pool") or None,
+        key_pool_size=integer("wireguard", "key_pool_size", "5000", minimum=0),
+        key_pool_encrypt=boolean("wireguard", "key_pool_encrypt", "true"),
+        output_path=output_path,
+        incremental=boolean("output", "incremental", "false"),
+        export_xlsx=boolean("output", "export_xlsx", "false"),
+        run_report=boolean("output", "run_report", "true"),
+        lock_timeout=integer("output", "lock_timeout", "300", minimum=0),
+        tunnels_format=reader.choice("output", "tunnels_format", "files", ["files", "zip", "tar"]),
+        bundle_groups=reader.choice("output", "bundle_groups", "none", ["none", "grupo", "razon_social"]),
+        qr_codes=reader.choice("output", "qr_codes", "none", ["none", "png", "pdf"]),
+        lookup=reader.choice("mikrotik", "lookup", "indexed", ["indexed", "scan"]),
+        chunk_size=integer("mikrotik", "chunk_size", "0", minimum=0),
+        routers=routers,
+        routeros_username=text("routeros", "username", "admin"),
+        routeros_password=text("routeros", "password"),
+        routeros_tls=boolean("routeros", "tls", "false"),
+        routeros_timeout=integer("routeros", "timeout", "10", minimum=1),
+        routeros_pool_size=integer("routeros", "pool_size", "4", minimum=1),
+        routeros_batch_size=integer("routeros", "batch_size", "200", minimum=1),
+    )
+    if reader.errors:
+        raise ConfigError("Configuracion invalida:\n" + "\n".join(reader.errors))
+    return Settings(**settings)
+
+
+def validate(config, check_paths=True):
+    """Parses and checks every option of `config` at once. Returns a Settings or raises ConfigError.
+
+    Cheap (no pandas, no I/O besides the existence check of database_path with
+    `check_paths`), so callers run it before starting any work. Results are
+    cached per config content.
+    """
+    snapshot = tuple((section, tuple(config.items(section, raw=True))) for section in config.sections())
+    settings = _parse(snapshot)
+    if check_paths and not os.path.exists(settings.database_path):
+        raise ConfigError(f"Configuracion invalida:\n[netconfig] database_path: no existe {settings.database_path!r}")
+    return settings
@@ -0,0 +1,341 @@
+import itertools
+import os
+import pandas as pd
+from contextlib import contextmanager
+from fsutil import replacing
+from instrumentation import count, timer
+
+# Columnas de la base de datos, en el orden en que se guardan
+COLUMNS = ["grupo", "subred", "razon_social", "punto_de_venta", "nombre_vpn", "ip", "clave_publica", "clave_privada"]
+
+# Columnas de doble pila, solo presentes cuando se asigna IPv6 (base_network6)
+IPV6_COLUMNS = ["subred6", "ip6"]
+
+
+def columns_of(df):
+    """Returns the database columns to save for `df`: COLUMNS plus the IPv6 ones it has."""
+    return COLUMNS + [column for column in IPV6_COLUMNS if column in df]
+
+
+def _cells(df):
+    """Yields the rows of the DataFrame as lists, with empty cells as None."""
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield list(row)
+
+
+def _without_trailing_blanks(rows):
+    """Yields the rows of a sheet except the empty ones at the end (read_excel drops them too)."""
+    blanks = []
+    for row in rows:
+        if all(value is None for value in row):
+            blanks.append(row)
+            continue
+        yield from blanks
+        blanks.clear()
+        yield row
+
+
+class CsvBackend:
+    """Database stored as CSV, read and written in blocks of rows."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        # Todo se lee como texto: solo las celdas vacias son nulas (no "NA", "None", ...)
+        return pd.read_csv(self.path, dtype=str, keep_default_na=False, na_values=[""])
+
+    def iter_chunks(self, chunksize):
+        return pd.read_csv(self.path, dtype=str, keep_default_na=False, na_values=[""], chunksize=chunksize)
+
+    def write(self, df):
+        with replacing(self.path) as tmp_path:
+            df.to_csv(tmp_path, index=False, chunksize=10000)
+
+    @contextmanager
+    def writer(self):
+        """Yields write(df), which appends a batch of rows. The file replaces `path` when the block ends."""
+        with replacing(self.path) as tmp_path, open(tmp_path, "w", newline="", encoding="utf-8") as file:
+            header = True
+
+            def write(df):
+                nonlocal header
+                df.to_csv(file, index=False, header=header)
+                header = False
+
+            yield write
+            if header:
+                write(pd.DataFrame(columns=COLUMNS))
+
+
+class ParquetBackend:
+    """Database stored as a columnar Parquet file (requires pyarrow)."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("El formato Parquet requiere pyarrow: pip install pyarrow")
+        self.path = path
+
+    def read(self):
+        df = pd.read_parquet(self.path)
+        return df.astype(object).where(df.notna(), float("nan"))
+
+    def iter_chunks(self, chunksize):
+        import pyarrow.parquet as pq
+
+        start = 0
+        for batch in pq.ParquetFile(self.path).iter_batches(batch_size=chunksize):
+            df = batch.to_pandas()
+            # Indice continuo entre lotes, como los de read_csv por bloques
+            df.index = range(start, start + len(df))
+            start += len(df)
+            yield df.astype(object).where(df.notna(), float("nan"))
+
+    def write(self, df):
+        # Guardar todo como texto para que cada columna tenga un solo tipo
+        with replacing(self.path) as tmp_path:
+            df.astype("string").to_parquet(tmp_path, index=False)
+
+    @contextmanager
+    def writer(self):
+        """Yields write(df), which appends a batch of rows as a row group. The file replaces `path` at the end."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with replacing(self.path) as tmp_path:
+            parquet_writer = None
+
+            def write(df):
+                nonlocal parquet_writer
+                table = pa.Table.from_pandas(df.astype("string"), preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(tmp_path, table.schema)
+                parquet_writer.write_table(table)
+
+            try:
+                yield write
+                if parquet_writer is None:
+                    write(pd.DataFrame(columns=COLUMNS))
+            finally:
+                if parquet_writer is not None:
+                    parquet_writer.close()
+
+
+class ExcelBackend:
+    """Database stored as .xlsx.
+
+    An existing workbook is updated in place: only the cells of the database
+    columns of its active sheet are written, so formatting, other sheets and
+    other columns are kept. A new workbook is written in one pass with
+    openpyxl's write-only mode. Batches (writer) are always written in
+    write-only mode, so memory does not grow with the workbook.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        return pd.read_excel(self.path)
+
+    def iter_chunks(self, chunksize):
+        # Modo read_only: openpyxl recorre las filas de la hoja sin cargarla entera en memoria
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            # Sin dimensiones guardadas (libros escritos en modo write_only) openpyxl corta las
+            # celdas vacias al final de cada fila: completarlas hasta el ancho del encabezado
+            width = len(header)
+            rows = (row[:width] + (None,) * (width - len(row)) for row in _without_trailing_blanks(rows))
+            start = 0
+            while True:
+                batch = list(itertools.islice(rows, chunksize))
+                if not batch:
+                    return
+                df = pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+                start += len(batch)
+                # Celdas vacias como NaN y columnas con un solo tipo, como read_excel
+                yield df.where(df.notna(), float("nan")).infer_objects()
+        finally:
+            workbook.close()
+
+    def write(self, df, template=None):
+        """Writes `df` to `path`. The workbook updated is `template` if given, else `path` when it exists."""
+        template = template or self.path
+        if os.path.exists(template):
+            workbook, update = _open_for_update(template)
+            update(df)
+            with replacing(self.path) as tmp_path:
+                workbook.save(tmp_path)
+            return
+        # openpyxl solo se carga si la base de datos es .xlsx
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        worksheet.append(list(df.columns))
+        for row in _cells(df):
+            worksheet.append(row)
+        with replacing(self.path) as tmp_path:
+            workbook.save(tmp_path)
+
+    @contextmanager
+    def writer(self):
+        """Yields write(df), which appends a batch of rows. The workbook is saved over `path` at the end.
+
+        The rows go to a write-only workbook, where openpyxl keeps them in a
+        temporary file, not in memory. An existing workbook is streamed into
+        it: its first sheet is read row by row in read-only mode and each batch
+        is written over the next rows, so the other columns and sheets keep
+        their values (not their cell formatting, which a full run preserves).
+        """
+        from openpyxl import Workbook, load_workbook
+
+        workbook = Workbook(write_only=True)
+        source = load_workbook(self.path, read_only=True) if os.path.exists(self.path) else None
+        try:
+            write, finish = _stream_update(source, workbook)
+            yield write
+            finish()
+        finally:
+            # Cerrar el libro leido antes de reemplazarlo (en Windows un archivo abierto no se reemplaza)
+            if source is not None:
+                source.close()
+        with replacing(self.path) as tmp_path:
+            workbook.save(tmp_path)
+
+
+def _open_for_update(path):
+    """Loads a workbook to update its active sheet. Returns (workbook, update(df)).
+
+    Each call to update(df) writes the next rows under the header, matching
+    columns by their header; missing database columns are added after the
+    last used column. Other cells are left as they are.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path)
+    worksheet = workbook.active
+    positions = {cell.value: cell.column for cell in worksheet[1] if cell.value is not None}
+    next_row = 2
+
+    def update(df):
+        nonlocal next_row
+        for column in df.columns:
+            if column not in positions:
+                positions[column] = (worksheet.max_column if positions else 0) + 1
+                worksheet.cell(row=1, column=positions[column], value=column)
+        targets = [positions[column] for column in df.columns]
+        for row_number, row in enumerate(_cells(df), next_row):
+            for column, value in zip(targets, row):
+                worksheet.cell(row=row_number, column=column, value=value)
+        next_row += len(df)
+
+    return workbook, update
+
+
+def _stream_update(source, workbook):
+    """Streams the sheets of `source` (a read-only workbook, or None) into the write-only `workbook`.
+
+    Returns (write(df), finish()). write(df) writes the next rows of the first
+    sheet with the values of `df` in the columns with its header (missing ones
+    are added after the last one) and the old values in the other columns.
+    finish() copies the other sheets.
+    """
+    sheets = source.worksheets if source is not None else []
+    worksheet = workbook.create_sheet(sheets[0].title) if sheets else workbook.create_sheet()
+    others = [(sheet, workbook.create_sheet(sheet.title)) for sheet in sheets[1:]]
+    rows = _without_trailing_blanks(sheets[0].iter_rows(values_only=True)) if sheets else iter(())
+    header = list(next(rows, ()))
+    positions = {value: position for position, value in enumerate(header) if value is not None}
+    started = False
+
+    def write(df):
+        nonlocal started
+        if not started:
+            for column in df.columns:
+                if column not in positions:
+                    positions[column] = len(header)
+                    header.append(column)
+            worksheet.append(header)
+            started = True
+        targets = [positions[column] for column in df.columns]
+        for values in _cells(df):
+            row = list(next(rows, ()))
+            row += [None] * (len(header) - len(row))
+            for position, value in zip(targets, values):
+                row[position] = value
+            worksheet.append(row)
+
+    def finish():
+        if not started:
+            write(pd.DataFrame(columns=COLUMNS))
+        for sheet, target in others:
+            for row in sheet.iter_rows(values_only=True):
+                target.append(row)
+
+    return write, finish
+
+
+BACKENDS = {
+    ".csv": CsvBackend,
+    ".parquet": ParquetBackend,
+    ".xlsx": ExcelBackend,
+}
+
+
+def get_backend(path):
+    """Returns the storage backend for a database file, chosen by its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in BACKENDS:
+        raise ValueError(f"Formato de base de datos no soportado: {path} (use .xlsx, .csv o .parquet)")
+    return BACKENDS[extension](path)
+
+
+def load_database(path):
+    """Reads the client database with the backend that matches its extension."""
+    try:
+        with timer("storage.read"):
+            df = get_backend(path).read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No se encontro el archivo {path}. Asegurate de crearlo primero.")
+    count("rows.read", len(df))
+    return df
+
+
+def save_database(df, path, template=None):
+    """Writes the client database with the backend that matches its extension.
+
+    The file is written to a temporary file that replaces `path` at the end:
+    readers and a failed run never see a half-written database. An .xlsx
+    workbook is updated in place (see ExcelBackend); `template` is the
+    workbook to start from when it is not `path` itself.
+    """
+    backend = get_backend(path)
+    with timer("storage.write"):
+        if template is not None and isinstance(backend, ExcelBackend):
+            backend.write(df, template)
+        else:
+            backend.write(df)
+    count("bytes.database", os.path.getsize(path))
+
+
+@contextmanager
+def database_writer(path):
+    """Counterpart of save_database for batches of rows: yields write(df), which appends one batch.
+
+    Rows go to a temporary file that replaces `path` when the block ends, so
+    `path` can be the database being read in batches.
+    """
+    with get_backend(path).writer() as write:
+        def timed_write(df):
+            with timer("storage.write"):
+                write(df)
+
+        yield timed_write
+    count("bytes.database", os.path.getsize(path))
@@ -0,0 +1,208 @@
+import json
+import mmap
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from fsutil import atomic_write
+
+# Plantilla del .conf de cada peer. Los campos comunes a todos los peers se rellenan una sola vez
+PEER_TEMPLATE = """[Interface]
+PrivateKey = {private_key}
+Address = {address}
+DNS = 1.1.1.1
+
+[Peer]
+PublicKey = {router_public_key}
+AllowedIPs = {allowed_ips}
+Endpoint = {endpoint}:{port}
+PersistentKeepalive = 30
+"""
+
+# Hilos por defecto para leer y escribir .conf (la latencia por archivo domina en carpetas de red)
+DEFAULT_WORKERS = 8
+
+
+# Lineas "PrivateKey = ..." / "PublicKey = ..." de un .conf (como startswith: el nombre puede seguir hasta el "=")
+_KEY_LINE = re.compile(rb"^[ \t]*(PrivateKey|PublicKey)[^=\r\n]*=([^\r\n]*)", re.MULTILINE)
+
+# A partir de este tamano el archivo se mapea en memoria en lugar de leerlo con os.read
+MMAP_THRESHOLD = 1 << 16
+
+
+def _parse_file(file_path):
+    """Parses a whole file with one os.read, or searching its mmap directly (no copy) when it is large."""
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        size = os.fstat(fd).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+                return parse_keys(mapped)
+        chunks = []
+        while True:
+            chunk = os.read(fd, max(size, 4096))
+            if not chunk:
+                return parse_keys(b"".join(chunks))
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+
+
+def parse_keys(data):
+    """Extracts PrivateKey/PublicKey from the bytes (or mmap) of a .conf. The last line of each wins."""
+    return {name.decode("ascii"): value.strip().decode("utf-8", errors="replace") for name, value in _KEY_LINE.findall(data)}
+
+
+def read_peer_config(file_path):
+    """Reads a WireGuard .conf and returns its PrivateKey/PublicKey, or None if the file does not exist."""
+    try:
+        return _parse_file(file_path)
+    except FileNotFoundError:
+        return None
+
+
+def config_name(nombre_vpn):
+    """Key used to match a VPN name against the files listed by `list_configs`."""
+    return os.path.normcase(f"{nombre_vpn}.conf")
+
+
+def list_configs(directory):
+    """Lists the .conf files of the tunnels folder once, as {normalized file name: path}."""
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return {}
+    with entries:
+        return {
+            os.path.normcase(entry.name): entry.path
+            for entry in entries
+            if entry.name.endswith(".conf") and entry.is_file()
+        }
+
+
+def read_key_pairs(paths, workers=DEFAULT_WORKERS, index=None):
+    """Parses many .conf files in a thread pool. Returns {path: config data} for the files that exist.
+
+    With a KeyIndex, files whose mtime and size did not change are not read again.
+    """
+    if index is not None:
+        return index.read(paths, workers)
+    results = map_in_chunks(read_peer_config, paths, workers)
+    return {path: data for path, data in zip(paths, results) if data is not None}
+
+
+def map_in_chunks(function, items, workers=DEFAULT_WORKERS):
+    """Like ThreadPoolExecutor.map, but each task handles a chunk of items.
+
+    One task per file costs more than reading a small .conf; a few chunks per thread keep the threads busy.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        return [function(item) for item in items]
+    size = -(-len(items) // (workers * 4))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [result for chunk in executor.map(lambda chunk: [function(item) for item in chunk], chunks) for result in chunk]
+
+
+class KeyIndex:
+    """Cache of the keys found in .conf files, keyed by path and validated by mtime and size.
+
+    It holds private keys, so it is stored as JSON encrypted with `cipher`
+    (a Fernet cipher, see keypool.make_cipher), like the key pool. An index
+    written with another key is discarded and the files are read again.
+    """
+
+    def __init__(self, path, cipher):
+        self.path = path
+        self.parsed = 0
+        self.cached = 0
+        self._cipher = cipher
+        self.entries = {}
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            data = b""
+        if data:
+            try:
+                self.entries = json.loads(cipher.decrypt(data))
+            except Exception:
+                # Otra clave o archivo danado: el indice se reconstruye
+                pass
+        self._changed = False
+
+    def _read(self, path):
+        """Returns (config data or None, parsed?) for one file, using the cache when it is still valid."""
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if self.entries.pop(key, None) is not None:
+                self._changed = True
+            return None, False
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2], False
+        data = read_peer_config(path)
+        if data is not None:
+            self.entries[key] = [stat.st_mtime_ns, stat.st_size, data]
+            self._changed = True
+        return data, True
+
+    def read(self, paths, workers=DEFAULT_WORKERS):
+        """Same result as read_key_pairs, parsing only the new or modified files."""
+        results = map_in_chunks(self._read, paths, workers)
+        found = {}
+        for path, (data, parsed) in zip(paths, results):
+            if data is not None:
+                found[path] = data
+                self.parsed += parsed
+                self.cached += not parsed
+        return found
+
+    def save(self):
+        """Writes the index if it changed."""
+        if self._changed:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            token = self._cipher.encrypt(json.dumps(self.entries).encode("utf-8"))
+            atomic_write(self.path, token.decode("ascii"), encoding="ascii", mode=0o600)
+            self._changed = False
+
+
+def compile_template(router_public_key, endpoint, port):
+    """Fills in the fields shared by every peer and returns the per-peer `format` function."""
+    template = PEER_TEMPLATE.format(
+        private_key="{private_key}",
+        address="{address}",
+        allowed_ips="{allowed_ips}",
+        router_public_key=_escape(router_public_key),
+        endpoint=_escape(endpoint),
+        port=_escape(port),
+    )
+    return template.format
+
+
+def _escape(value):
+    return str(value).replace("{", "{{").replace("}", "}}")
+
+
+def _write(path, text, atomic):
+    if atomic:
+        atomic_write(path, text)
+    else:
+        with open(path, "w") as outfile:
+            outfile.write(text)
+
+
+def write_configs(files, workers=DEFAULT_WORKERS, atomic=True):
+    """Writes (path, text) pairs with a bounded pool of threads.
+
+    With `atomic` each file is written to a temporary file and renamed into
+    place. The first error raised by a write is propagated to the caller.
+    """
+    files = list(files)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # Consumir los resultados para que los errores de escritura no se pierdan
+        for _ in executor.map(lambda item: _write(item[0], item[1], atomic), files):
+            pass
+    return len(files)
@@ -0,0 +1,109 @@
+import base64
+import os
+import subprocess
+
+# Backend opcional: si cryptography esta instalado se usa su X25519 (implementado en C)
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+except ImportError:  # pragma: no cover - depende del entorno
+    X25519PrivateKey = None
+
+# Parametros de Curve25519 (RFC 7748)
+_P = 2**255 - 19
+_A24 = 121665
+_BASE_POINT = (9).to_bytes(32, "little")
+
+
+def _clamp(private_bytes):
+    """Applies the X25519 clamping that `wg genkey` applies to every private key."""
+    key = bytearray(private_bytes)
+    key[0] &= 248
+    key[31] &= 127
+    key[31] |= 64
+    return bytes(key)
+
+
+def _x25519(scalar_bytes, u_bytes):
+    """Pure-Python X25519 scalar multiplication (Montgomery ladder, RFC 7748)."""
+    k = int.from_bytes(_clamp(scalar_bytes), "little")
+    x1 = int.from_bytes(u_bytes, "little") & ((1 << 255) - 1)
+    x2, z2, x3, z3 = 1, 0, x1, 1
+    swap = 0
+
+    for t in range(254, -1, -1):
+        k_t = (k >> t) & 1
+        swap ^= k_t
+        if swap:
+            x2, x3 = x3, x2
+            z2, z3 = z3, z2
+        swap = k_t
+
+        a = (x2 + z2) % _P
+        aa = a * a % _P
+        b = (x2 - z2) % _P
+        bb = b * b % _P
+        e = (aa - bb) % _P
+        c = (x3 + z3) % _P
+        d = (x3 - z3) % _P
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = (da + cb) % _P
+        x3 = x3 * x3 % _P
+        z3 = (da - cb) % _P
+        z3 = x1 * (z3 * z3 % _P) % _P
+        x2 = aa * bb % _P
+        z2 = e * ((aa + _A24 * e) % _P) % _P
+
+    if swap:
+        x2, x3 = x3, x2
+        z2, z3 = z3, z2
+
+    return (x2 * pow(z2, _P - 2, _P) % _P).to_bytes(32, "little")
+
+
+def _public_bytes(private_bytes):
+    """Derives the raw public key for a (clamped) private key."""
+    if X25519PrivateKey is not None:
+        return X25519PrivateKey.from_private_bytes(private_bytes).public_key().public_bytes_raw()
+    return _x25519(private_bytes, _BASE_POINT)
+
+
+def public_key(private_key):
+    """Returns the base64 public key for a base64 private key, like `wg pubkey`."""
+    private_bytes = base64.b64decode(private_key)
+    if len(private_bytes) != 32:
+        raise ValueError("La clave privada debe tener 32 bytes.")
+    return base64.b64encode(_public_bytes(_clamp(private_bytes))).decode("ascii")
+
+
+def generate_keypair():
+    """Generates one (private_key, public_key) pair in base64, like `wg genkey | wg pubkey`."""
+    private_bytes = _clamp(os.urandom(32))
+    return (
+        base64.b64encode(private_bytes).decode("ascii"),
+        base64.b64encode(_public_bytes(private_bytes)).decode("ascii"),
+    )
+
+
+def generate_keys(n):
+    """Generates a batch of n (private_key, public_key) pairs in-process."""
+    return [generate_keypair() for _ in range(n)]
+
+
+def generate_keys_subprocess(n):
+    """Generates n key pairs calling the `wg` binary. Kept as a fallback for the native engine."""
+    keys = []
+    for _ in range(n):
+        private_key = subprocess.check_output(["wg", "genkey"]).decode("utf-8").strip()
+        public_key = subprocess.check_output(["wg", "pubkey"], input=private_key.encode("utf-8")).decode("utf-8").strip()
+        keys.append((private_key, public_key))
+    return keys
+
+
+def get_key_generator(backend="native"):
+    """Returns the batch generator for the configured backend ("native" or "wg")."""
+    if backend == "native":
+        return generate_keys
+    if backend == "wg":
+        return generate_keys_subprocess
+    raise ValueError(f"Backend de claves desconocido: {backend}")
@@ -1,137 +1,335 @@
 import os
-import subprocess
-import pandas as pd
-from openpyxl import load_workbook
-import configparser
-
-# Cargar el archivo de configuración
-config = configparser.ConfigParser()
-config.read("src/config.ini")
-
-# Leer valores del archivo de configuración
-database_path = config["netconfig"].get("database_path")
-output_path = config["output"].get("output_path")
-output_peers_directory = os.path.join(output_path, "tunnels/")  # Directorio para los archivos de los peers WireGuard
-public_key_custom_text = config["wireguard"].get("public_key_custom_text")
-endpoint_custom_text = config["wireguard"].get("endpoint_custom_text")
-port_custom_text = config["wireguard"].get("port_custom_text")
-
-# Archivos de salida
-output_csv = os.path.splitext(database_path)[0] + ".csv"  # Directorio para el archivo CSV
-output_connect_csv = os.path.splitext(database_path)[0] + "_rdc.csv"
-
-# Crear los directorios de salida si no existen
-os.makedirs(output_peers_directory, exist_ok=True)
-
-# Función para generar claves privadas y públicas
-def generate_keys():
-    private_key = subprocess.check_output("wg genkey", shell=True).decode("utf-8").strip()
-    public_key = subprocess.check_output(f"echo {private_key} | wg pubkey", shell=True).decode("utf-8").strip()
-    return private_key, public_key
-
-# Función para leer un archivo .conf existente
-def read_peer_config(file_path):
-    """Lee un archivo de configuración de WireGuard y devuelve sus parámetros clave."""
-    if not os.path.exists(file_path):
-        return None
-
-    with open(file_path, "r") as file:
-        lines = file.readlines()
-
-    config_data = {}
-    for line in lines:
-        if line.strip().startswith("PrivateKey"):
-            config_data["PrivateKey"] = line.split("=")[-1].strip()
-        elif line.strip().startswith("PublicKey"):
-            config_data["PublicKey"] = line.split("=")[-1].strip()
-    return config_data
-
-# Cargar datos del archivo Excel
-df = pd.read_excel(database_path)
-
-# Leer configuraciones existentes
-existing_configs = {}
-for index, row in df.iterrows():
-    nombre_vpn = row["nombre_vpn"]
-    if pd.notna(nombre_vpn):
-        config_file = os.path.join(output_peers_directory, f"{nombre_vpn}.conf")
-        if os.path.exists(config_file):
-            existing_configs[nombre_vpn] = read_peer_config(config_file)
-
-# Generar claves y configuraciones
-for index, row in df.iterrows():
-    nombre_vpn = row["nombre_vpn"]
-    subred = row["subred"]
-    ip = row["ip"]
-
-    # Verificar si ya hay claves en el Excel
-    if pd.notna(row["clave_publica"]) and pd.notna(row["clave_privada"]):
-        # Recuperar claves existentes del Excel
-        private_key = row["clave_privada"]
-        public_key = row["clave_publica"]
-    elif nombre_vpn in existing_configs:
-        # Recuperar claves de configuraciones existentes si están en el directorio de peers
-        private_key = existing_configs[nombre_vpn]["PrivateKey"]
-        public_key = existing_configs[nombre_vpn]["PublicKey"]
+import storage
+from contextlib import ExitStack, contextmanager
+from allocdb import AllocationStore
+from bundles import bundle_path, export_options, member_name, write_bundle, write_qr_codes
+from fsutil import replacing
+from keypool import make_cipher, take_keys
+from instrumentation import count, timer
+from settings import key_index_path, load_config, run_lock, validate, wireguard_output_paths, xlsx_export_path
+from tunnels import KeyIndex, compile_template, config_name, list_configs, read_key_pairs, write_configs
+from wgkeys import public_key
+
+
+class ConfigFiles:
+    """The .conf files of the tunnels folder, listed once for a run made of several batches of rows."""
+
+    def __init__(self, settings):
+        output_peers_directory, _, _ = wireguard_output_paths(settings)
+        self.existing = list_configs(output_peers_directory)  # Nombre del archivo -> ruta, antes de la ejecucion
+        self.written = set(self.existing)  # Nombres con archivo, incluidos los escritos por lotes anteriores
+        self.index_path = key_index_path(settings)
+        self._index = None
+
+    @property
+    def index(self):
+        """KeyIndex of the run, read on first use. None without the cryptography package: every .conf is read."""
+        if self._index is None:
+            try:
+                self._index = KeyIndex(self.index_path, make_cipher(self.index_path + ".key"))
+            except ImportError:
+                print("Indice de claves desactivado: requiere el paquete cryptography (pip install cryptography). Se leen todos los .conf.")
+                self._index = False
+        return self._index or None
+
+    def save(self):
+        """Writes the key index if it was used."""
+        if self._index:
+            self._index.save()
+
+
+def addressed(df):
+    """Mask of the rows with an IP and a VPN name: the only peers that get keys and a .conf file."""
+    return df["ip"].notna() & df["nombre_vpn"].notna()
+
+
+def assign_keys(df, settings, store=None, files=None, stats=None):
+    """Fills in the keys of every peer, recovering them from existing .conf files or generating new ones.
+
+    With `allocation_db` set, keys stored there for a peer's IP are used
+    first, and every key pair ends up stored in it. Chunked runs pass their
+    open AllocationStore and the ConfigFiles shared by every batch. `stats`
+    (a dict) gets under "keys" the number of new keys, generated or taken
+    from the pool; recovered keys do not count.
+    """
+    db_path = settings.allocation_db
+
+    # Las columnas de claves vacias se leen como float: pasarlas a object antes de escribir texto
+    for column in ["clave_publica", "clave_privada"]:
+        df[column] = df[column].astype(object)
+
+    own_files = files is None
+    if own_files:
+        with timer("wireguard.read_configs"):
+            files = ConfigFiles(settings)
+    if stats is None:
+        stats = {}
+    if db_path is None:
+        df = _assign_keys(df, settings, files, stats)
+    elif store is not None:
+        df = _assign_stored_keys(df, settings, files, store, stats)
     else:
-        # Generar nuevas claves si no existen
-        private_key, public_key = generate_keys()
+        with AllocationStore(db_path) as store, store.transaction():
+            df = _assign_stored_keys(df, settings, files, store, stats)
+    if own_files:
+        files.save()
+    return df
+
+
+def _assign_stored_keys(df, settings, files, store, stats):
+    """Recovers from the allocation index the keys of the peers missing them, then fills in the rest."""
+    missing = (df["clave_publica"].isna() | df["clave_privada"].isna()) & addressed(df)
+    with timer("wireguard.read_db"):
+        stored = store.keys_for_ips(df.loc[missing, "ip"].unique())
+    for index in df.index[missing]:
+        keys = stored.get(df.at[index, "ip"])
+        if keys is not None:
+            df.at[index, "clave_privada"], df.at[index, "clave_publica"] = keys
+    count("keys.from_db", len(stored))
+    df = _assign_keys(df, settings, files, stats)
+    store.save_peers(df)
+    return df
+
 
-        # Actualizar el DataFrame con las claves generadas
-        df.at[index, "clave_publica"] = public_key
+def _assign_keys(df, settings, files, stats):
+    """Fills in the missing keys from existing .conf files or a new batch. Rows without an IP get no keys."""
+    # Leer solo los .conf de los peers sin claves en el Excel (la carpeta se listo una sola vez)
+    with timer("wireguard.read_configs"):
+        missing = (df["clave_publica"].isna() | df["clave_privada"].isna()) & addressed(df)
+        paths = {}
+        for nombre_vpn in df.loc[missing, "nombre_vpn"].unique():
+            path = files.existing.get(config_name(nombre_vpn))
+            if path is not None:
+                paths[nombre_vpn] = path
+        # Los .conf que no cambiaron desde la ultima lectura (mismo mtime y tamano) se toman del indice
+        index = files.index if paths else None
+        parsed_before, cached_before = (index.parsed, index.cached) if index is not None else (0, 0)
+        parsed = read_key_pairs(list(paths.values()), settings.io_workers, index)
+        existing_configs = {
+            nombre_vpn: parsed[path] for nombre_vpn, path in paths.items() if parsed.get(path, {}).get("PrivateKey")
+        }
+    count("files.conf_read", index.parsed - parsed_before if index is not None else 0)
+    count("files.conf_cached", index.cached - cached_before if index is not None else 0)
+
+    # Tomar del pool (o generar en un solo lote) las claves de los peers que no tienen ni claves en el Excel ni archivo .conf
+    missing_keys = missing & ~df["nombre_vpn"].isin(existing_configs.keys())
+    with timer("wireguard.keygen"):
+        keys, from_pool = take_keys(settings, int(missing_keys.sum()))
+        new_keys = iter(keys)
+    stats["keys"] = len(keys)
+    count("keys.from_pool", from_pool)
+    count("keys.generated", len(keys) - from_pool)
+    count("keys.recovered", len(existing_configs))
+
+    # Solo las filas sin claves en el Excel y con IP
+    for index, nombre_vpn in df.loc[missing, "nombre_vpn"].items():
+        if nombre_vpn in existing_configs:
+            # Recuperar la clave privada de configuraciones existentes si están en el directorio de peers.
+            # El PublicKey del .conf es el del router: la clave pública del peer se deriva de la privada.
+            private_key = existing_configs[nombre_vpn]["PrivateKey"]
+            peer_public_key = public_key(private_key)
+        else:
+            # Tomar las nuevas claves del lote generado
+            private_key, peer_public_key = next(new_keys)
+
+        # Actualizar el DataFrame con las claves
+        df.at[index, "clave_publica"] = peer_public_key
         df.at[index, "clave_privada"] = private_key
 
-    # Revisar si ya existe un archivo de configuración para el peer
-    config_file = os.path.join(output_peers_directory, f"{nombre_vpn}.conf")
-    if not os.path.exists(config_file):
-        # Crear el archivo de configuración si no existe
-        peer_config = f"""[Interface]
-PrivateKey = {private_key}
-Address = {ip}
-DNS = 1.1.1.1
-
-[Peer]
-PublicKey = {public_key_custom_text}
-AllowedIPs = {subred}
-Endpoint = {endpoint_custom_text}:{port_custom_text}
-PersistentKeepalive = 30
-"""
-        with open(config_file, "w") as outfile:
-            outfile.write(peer_config)
-
-# Reordenar columnas y agregar clave_privada como última columna
-df = df[["grupo", "subred", "razon_social", "punto_de_venta", "nombre_vpn", "ip", "clave_publica", "clave_privada"]]
-dfconnect = df[["ip"]]
-
-# Guardar el DataFrame actualizado en el archivo CSV
-df.to_csv(output_csv, index=False)
-dfconnect.to_csv(output_connect_csv, index=False, header=False)
-
-# Actualizar el archivo Excel sin modificar el formato
-workbook = load_workbook(database_path)
-worksheet = workbook.active
-
-# Escribir los valores en el orden correcto
-header_map = {  # Mapeo de columnas para Excel
-    "grupo": "A",
-    "subred": "B",
-    "razon_social": "C",
-    "punto_de_venta": "D",
-    "nombre_vpn": "E",
-    "ip": "F",
-    "clave_publica": "G",
-    "clave_privada": "H",  # Columna para la clave_privada
-}
-
-# Escribir encabezados
-for col_name, col_letter in header_map.items():
-    worksheet[f"{col_letter}1"] = col_name
-
-# Escribir datos
-for index, row in df.iterrows():
-    for col_name, col_letter in header_map.items():
-        worksheet[f"{col_letter}{index + 2}"] = row[col_name]
-
-workbook.save(database_path)
-
-print(f"Archivos generados y actualizados:\n- Configuraciones de peers en: {output_peers_directory}\n- CSV: {output_csv}\n- Excel: {database_path}")
+    return df
+
+
+def write_peer_configs(df, settings, only=None):
+    """Writes the .conf file of every peer that does not have one yet. Returns the number of files written.
+
+    With `only` (a boolean mask over the rows) just those peers are written,
+    overwriting their files, and no other file is checked. With
+    `tunnels_format = zip|tar` every peer goes into one archive instead (see
+    bundles.py), and `qr_codes` adds the QR codes of every peer.
+    """
+    tunnels_format, groups, qr_codes = export_options(settings)
+    if tunnels_format != "files" or qr_codes is not None:
+        written = export_tunnels(lambda: [df], settings, tunnels_format, groups, qr_codes)
+        if tunnels_format != "files":
+            return written
+    return write_tunnel_files(df, settings, only)
+
+
+def write_tunnel_files(df, settings, only=None, files=None):
+    """Writes the .conf files of the tunnels folder (see write_peer_configs). Returns the number written.
+
+    `files` (a ConfigFiles) replaces the scan of the folder: chunked runs list
+    it once and every batch adds the names it wrote.
+    """
+    # Leer valores del archivo de configuración
+    output_peers_directory, _, _ = wireguard_output_paths(settings)
+    render = peer_template(settings)
+
+    # Crear los directorios de salida si no existen
+    os.makedirs(output_peers_directory, exist_ok=True)
+
+    # Revisar de una sola vez que peers ya tienen archivo de configuracion
+    if only is not None:
+        existing_files = set()
+    elif files is not None:
+        existing_files = files.written
+    else:
+        existing_files = set(list_configs(output_peers_directory))
+
+    rows = df if only is None else df[only]
+    rows = rows[addressed(rows)]
+    # Con doble pila Address y AllowedIPs llevan las dos familias
+    addresses = dual_stack(rows, "ip", "ip6")
+    allowed_ips = dual_stack(rows, "subred", "subred6")
+    configs = {}
+    with timer("wireguard.conf_render"):
+        for nombre_vpn, private_key, ip, subred in zip(rows["nombre_vpn"], rows["clave_privada"], addresses, allowed_ips):
+            name = config_name(nombre_vpn)
+            if name in existing_files:
+                continue
+            if only is None:
+                # Con nombres repetidos se conserva el primero, como si el archivo ya existiera
+                existing_files.add(name)
+            config_file = os.path.join(output_peers_directory, f"{nombre_vpn}.conf")
+            configs[config_file] = render(private_key=private_key, address=ip, allowed_ips=subred)
+
+    # Escribir los archivos en paralelo (a traves de un temporal si atomic_writes esta activo)
+    with timer("wireguard.conf_write"):
+        written = write_configs(configs.items(), settings.io_workers, settings.atomic_writes)
+    count("files.conf", written)
+    count("bytes.conf", sum(len(text) for text in configs.values()))
+    return written
+
+
+def peer_template(settings):
+    """Returns the `format` function that renders the .conf file of one peer."""
+    return compile_template(settings.router_public_key, settings.endpoint, str(settings.port))
+
+
+def export_tunnels(frames, settings, tunnels_format, groups, qr_codes):
+    """Writes the archive (zip/tar) and/or the QR codes with every peer. Returns the files in the archive.
+
+    `frames` returns the DataFrames with the peers: one, or the batches of a
+    chunked run, read again for each output. Archives and QR codes always
+    hold every peer, also in incremental runs: they are a full snapshot.
+    """
+    output_path = settings.output_path
+    render = peer_template(settings)
+
+    def entries(extension=".conf"):
+        seen = set()
+        for df in frames():
+            df = df[addressed(df)]
+            addresses = dual_stack(df, "ip", "ip6")
+            allowed_ips = dual_stack(df, "subred", "subred6")
+            group_values = df[groups] if groups is not None else [None] * len(df)
+            for nombre_vpn, group, private_key, ip, subred in zip(df["nombre_vpn"], group_values, df["clave_privada"], addresses, allowed_ips):
+                # Con nombres repetidos se conserva el primero, como en la carpeta de tunnels
+                name = config_name(nombre_vpn)
+                if name in seen:
+                    continue
+                seen.add(name)
+                yield member_name(nombre_vpn, group, extension), render(private_key=private_key, address=ip, allowed_ips=subred)
+
+    written = 0
+    if tunnels_format != "files":
+        with timer("wireguard.bundle_write"):
+            written, size = write_bundle(bundle_path(output_path, tunnels_format), entries(), tunnels_format)
+        count("files.bundle", written)
+        count("bytes.bundle", size)
+    if qr_codes is not None:
+        with timer("wireguard.qr_codes"):
+            codes = write_qr_codes(output_path, entries(".png" if qr_codes == "png" else ""), qr_codes)
+        count("files.qr", codes)
+    return written
+
+
+def dual_stack(df, column, column6):
+    """Returns `column` joined with `column6` as "v4, v6" when the IPv6 column exists and has a value."""
+    if column6 not in df:
+        return df[column]
+    has_ipv6 = df[column6].notna()
+    joined = df[column].where(~has_ipv6, df[column].astype(str) + ", " + df[column6].astype(str))
+    # Filas solo con IPv6 (sin IPv4 disponible): solo la direccion IPv6
+    return joined.where(df[column].notna() | ~has_ipv6, df[column6])
+
+
+def save_database(df, settings):
+    """Writes the CSV files and the database (plus the optional .xlsx export)."""
+    database_path = settings.database_path
+    output_peers_directory, output_csv, output_connect_csv = wireguard_output_paths(settings)
+
+    # Reordenar columnas y agregar clave_privada como última columna
+    df = df[storage.columns_of(df)]
+    dfconnect = df[["ip"]]
+
+    # Guardar el DataFrame actualizado en el archivo CSV
+    with timer("wireguard.csv_write"):
+        with replacing(output_csv) as tmp_path:
+            df.to_csv(tmp_path, index=False)
+        with replacing(output_connect_csv) as tmp_path:
+            dfconnect.to_csv(tmp_path, index=False, header=False)
+
+    # Guardar la base de datos en su formato (si es CSV ya se escribió arriba)
+    written = [output_csv]
+    if database_path != output_csv:
+        storage.save_database(df, database_path)
+        written.append(database_path)
+
+    # Exportar a Excel si la base de datos es CSV/Parquet y se pidió en la configuración
+    if settings.export_xlsx and not database_path.lower().endswith(".xlsx"):
+        storage.save_database(df, xlsx_export_path(settings))
+        written.append(xlsx_export_path(settings))
+
+    print(f"Archivos generados y actualizados:\n- Configuraciones de peers en: {output_peers_directory}\n" + "\n".join(f"- {path}" for path in written))
+    return df
+
+
+@contextmanager
+def database_writer(settings):
+    """Counterpart of save_database for chunked runs: yields write(df), which appends one batch of rows.
+
+    Every file is written to a temporary file that replaces the old one when
+    the block ends without errors.
+    """
+    database_path = settings.database_path
+    output_peers_directory, output_csv, output_connect_csv = wireguard_output_paths(settings)
+    paths = [output_csv]
+    if database_path != output_csv:
+        paths.append(database_path)
+    if settings.export_xlsx and not database_path.lower().endswith(".xlsx"):
+        paths.append(xlsx_export_path(settings))
+
+    with ExitStack() as stack:
+        writers = [stack.enter_context(storage.database_writer(path)) for path in paths]
+        connect = stack.enter_context(open(stack.enter_context(replacing(output_connect_csv)), "w", newline="", encoding="utf-8"))
+
+        def write(df):
+            df = df[storage.columns_of(df)]
+            with timer("wireguard.csv_write"):
+                df[["ip"]].to_csv(connect, index=False, header=False)
+            for write_database in writers:
+                write_database(df)
+
+        yield write
+    print(f"Archivos generados y actualizados:\n- Configuraciones de peers en: {output_peers_directory}\n" + "\n".join(f"- {path}" for path in paths))
+
+
+def run(settings, df=None):
+    """Runs the WireGuard stage. Reads the database unless a DataFrame is given."""
+    if df is None:
+        # Cargar datos de la base de datos
+        df = storage.load_database(settings.database_path)
+    df = assign_keys(df, settings)
+    write_peer_configs(df, settings)
+    return save_database(df, settings)
+
+
+def main():
+    settings = validate(load_config())
+    with run_lock(settings):
+        run(settings)
+
+
+if __name__ == "__main__":
+    main()